@@ -0,0 +1,147 @@
+from logutil import log
+from http_client import safe_request
+from decoding import ItemRecord, decode_response
+
+ITEM_LIST_URL = "https://shopee.co.id/api/v4/item/get_list"
+SHOP_ITEMS_URL = "https://shopee.co.id/api/v4/shop/search_items"
+
+
+def product_key(product: dict) -> str:
+    return f"{product['shop_id']}_{product['item_id']}"
+
+
+def item_to_info(item: dict, source: str) -> dict:
+    return ItemRecord.from_item(item).info(source)
+
+
+def group_by_shop(products: list[dict]) -> dict[str, list[str]]:
+    # Dicts keep first-seen order and make the duplicate check O(1)
+    shops: dict[str, dict[str, None]] = {}
+    for product in products:
+        shops.setdefault(str(product["shop_id"]), {})[str(product["item_id"])] = None
+    return {shop_id: list(items) for shop_id, items in shops.items()}
+
+# ========= Batched Item Lookups =========
+class BatchFetcher:
+    """Resolves many products per round trip, grouped by shop.
+
+    Each shop's items go through the multi-item `get_list` endpoint in chunks
+    of `batch_size`. If a chunk fails and the shop has at least
+    `listing_threshold` watched items, the shop listing is paged instead.
+    Whatever is still missing is left for the caller's single-item path.
+    With an `identities` pool, requests rotate over its sessions instead of
+    going through `session`. When an item lands in a different chunk (a
+    watchlist edit, a reshard) the cache entry of its old chunk is dropped.
+    """
+
+    def __init__(self, session, headers_fn, limiter=None,
+                 batch_size: int = 50, listing_threshold: int = 10, listing_pages: int = 5,
+                 cache=None, breakers=None, identities=None):
+        self.session = session
+        self.headers_fn = headers_fn
+        self.limiter = limiter
+        self.batch_size = max(1, int(batch_size))
+        self.listing_threshold = listing_threshold
+        self.listing_pages = listing_pages
+        self.cache = cache
+        self.breakers = breakers
+        self.identities = identities
+        self.requests_made = 0
+        # product key -> cache key of the chunk it was last fetched in
+        self._chunk_of: dict[str, str] = {}
+
+    def _request(self, url: str, tag: str, **kwargs):
+        if self.identities is not None:
+            return self.identities.request(url, tag=tag, breakers=self.breakers, **kwargs)
+        return safe_request(self.session, url, headers=self.headers_fn(), tag=tag, limiter=self.limiter,
+                            breakers=self.breakers, **kwargs)
+
+    def _fetch_chunk(self, shop_id: str, item_ids: list[str]) -> dict[str, dict] | None:
+        body = {"shop_item_ids": [{"shopid": int(shop_id), "itemid": int(i)} for i in item_ids]}
+        cache_key = f"batch:{shop_id}:{','.join(item_ids)}"
+        self._track_chunk(shop_id, item_ids, cache_key)
+        self.requests_made += 1
+        resp = self._request(ITEM_LIST_URL, "batch-get-list", method="POST", json_body=body)
+        if not resp or resp.status_code != 200:
+            return None
+        if self.cache is not None:
+            # Identical chunk body: every item in it is unchanged, skip decoding
+            cached = self.cache.lookup(cache_key, resp)
+            if cached is not None:
+                return {item_id: {**record.info("batch"), "unchanged": True}
+                        for item_id, record in cached.items()}
+        try:
+            items = decode_response(resp).get("data") or []
+        except Exception as e:
+            log("warning", "Batch parse error", shop_id=shop_id, error=str(e))
+            return None
+        records = {}
+        for item in items:
+            if item and str(item.get("itemid")) in item_ids:
+                records[str(item["itemid"])] = ItemRecord.from_item(item)
+        if self.cache is not None:
+            self.cache.store(cache_key, resp, records)
+        return {item_id: record.info("batch") for item_id, record in records.items()}
+
+    def _track_chunk(self, shop_id: str, item_ids: list[str], cache_key: str):
+        if self.cache is None:
+            return
+        for item_id in item_ids:
+            old = self._chunk_of.get(f"{shop_id}_{item_id}")
+            if old is not None and old != cache_key:
+                self.cache.discard(old)
+            self._chunk_of[f"{shop_id}_{item_id}"] = cache_key
+
+    def forget(self, key: str):
+        """Drop the cached chunk holding product `key` (e.g. once it leaves the watchlist)."""
+        old = self._chunk_of.pop(key, None)
+        if old is not None and self.cache is not None:
+            self.cache.discard(old)
+
+    def _fetch_listing(self, shop_id: str, item_ids: list[str]) -> dict[str, dict]:
+        wanted = set(item_ids)
+        found = {}
+        limit = 100
+        for page in range(self.listing_pages):
+            self.requests_made += 1
+            resp = self._request(SHOP_ITEMS_URL, "batch-shop-listing",
+                                 params={"shopid": shop_id, "limit": limit, "offset": page * limit,
+                                         "order": "desc", "sort_by": "pop", "filter_sold_out": 0})
+            if not resp or resp.status_code != 200:
+                break
+            try:
+                data = decode_response(resp)
+                entries = data.get("items") or (data.get("data") or {}).get("items") or []
+            except Exception as e:
+                log("warning", "Shop listing parse error", shop_id=shop_id, error=str(e))
+                break
+            for entry in entries:
+                item = entry.get("item_basic") or entry
+                item_id = str(item.get("itemid"))
+                if item_id in wanted:
+                    found[item_id] = item_to_info(item, "shop-listing")
+            if len(found) == len(wanted) or len(entries) < limit:
+                break
+        return found
+
+    def fetch_many(self, products: list[dict]) -> dict[str, dict]:
+        """Return {product_key: info} for every product resolved in bulk."""
+        results = {}
+        self.requests_made = 0
+        for shop_id, item_ids in group_by_shop(products).items():
+            shop_found: dict[str, dict] = {}
+            failed = []
+            for start in range(0, len(item_ids), self.batch_size):
+                chunk = item_ids[start:start + self.batch_size]
+                found = self._fetch_chunk(shop_id, chunk)
+                if found is None:
+                    failed.extend(chunk)
+                else:
+                    shop_found.update(found)
+            if failed and len(item_ids) >= self.listing_threshold:
+                shop_found.update(self._fetch_listing(shop_id, failed))
+            for item_id, info in shop_found.items():
+                results[f"{shop_id}_{item_id}"] = info
+        log("info", "Batch lookup done", products=len(products), resolved=len(results),
+            misses=len(products) - len(results), requests=self.requests_made)
+        return results
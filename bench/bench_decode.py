@@ -0,0 +1,114 @@
+"""Compare the old `resp.json()` item parsing with the projected decode path.
+
+    python -m bench.bench_decode --payload-kb 4,32,128 --models 3,20
+
+Each payload mimics an /item/get body: the fields the monitor reads plus
+images, attributes, tier variations and a long description.
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import requests
+
+import decoding
+from decoding import decode_response, project_item
+from variants import models_from_item
+
+
+def make_payload(payload_kb: int, models: int) -> bytes:
+    item = {
+        "itemid": 28841260015, "shopid": 581472460, "name": "Produk Contoh Ukuran Besar",
+        "price": 1500000000, "price_min": 1500000000, "price_max": 1600000000, "stock": 7,
+        "models": [{"modelid": 1000 + m, "name": f"Variant {m}", "stock": m % 4, "price": 1500000000 + m,
+                    "extinfo": {"tier_index": [m % 5, m // 5]}, "promotionid": 0} for m in range(models)],
+        "tier_variations": [{"name": "Warna", "options": [f"Warna {i}" for i in range(5)]},
+                            {"name": "Ukuran", "options": ["S", "M", "L", "XL"]}],
+        "images": [f"{i:032x}" for i in range(20)],
+        "attributes": [{"name": f"Atribut {i}", "value": f"Nilai {i}", "id": i} for i in range(15)],
+        "categories": [{"catid": i, "display_name": f"Kategori {i}"} for i in range(3)],
+        "item_rating": {"rating_star": 4.8, "rating_count": [120, 1, 2, 3, 10, 104]},
+    }
+    base = len(json.dumps({"error": 0, "data": item}))
+    item["description"] = "Deskripsi produk. " * max(0, (payload_kb * 1024 - base) // 18)
+    return json.dumps({"error": 0, "data": item}).encode()
+
+
+def make_response(body: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = body
+    resp.headers["Content-Type"] = "application/json"
+    return resp
+
+
+def parse_old(resp) -> dict | None:
+    # The pre-projection code path from fetch_method1
+    data = resp.json()
+    if not data.get("data"):
+        return None
+    item = data["data"]
+    raw_price = item.get("price", 0)
+    price_rp = (raw_price / 100000) if isinstance(raw_price, (int, float)) else 0
+    stock = item.get("stock", 0) or 0
+    return {"name": item.get("name", "Unknown"), "stock": stock, "price": price_rp,
+            "available": stock > 0, "source": "method1", "models": models_from_item(item)}
+
+
+def parse_new(resp):
+    return project_item(decode_response(resp), "data")
+
+
+def measure(fn, body: bytes, loops: int) -> dict:
+    # Fresh Response per call, as each fetch gets its own
+    responses = [make_response(body) for _ in range(loops)]
+    started = time.perf_counter()
+    for resp in responses:
+        fn(resp)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    result = fn(make_response(body))
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    fn(make_response(body))
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {"us_per_product": round(elapsed / loops * 1e6, 1), "peak_alloc_kb": round(peak / 1024, 1),
+            "retained_bytes": _deep_size(result)}
+
+
+def _deep_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_size(v) for v in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_deep_size(getattr(obj, s)) for s in obj.__slots__)
+    return size
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payload-kb", default="4,32,128")
+    parser.add_argument("--models", default="3,20")
+    parser.add_argument("--loops", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    print(f"decoder: {decoding.JSON_BACKEND}")
+    print(f"{'payload_kb':>10} {'models':>6}  {'path':<4} {'us/product':>10} {'peak_kb':>8} {'retained_B':>10}")
+    for kb in (int(k) for k in args.payload_kb.split(",")):
+        for models in (int(m) for m in args.models.split(",")):
+            body = make_payload(kb, models)
+            loops = max(50, args.loops * 4 // max(4, kb))
+            for name, fn in (("old", parse_old), ("new", parse_new)):
+                r = measure(fn, body, loops)
+                print(f"{kb:>10} {models:>6}  {name:<4} {r['us_per_product']:>10} "
+                      f"{r['peak_alloc_kb']:>8} {r['retained_bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main_cli()
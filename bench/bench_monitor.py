@@ -0,0 +1,217 @@
+"""Benchmark both monitor variants against the local fake Shopee server.
+
+    python -m bench.bench_monitor --sizes 10,100,1000 --passes 3 --latency-ms 20
+
+Outgoing requests to shopee.co.id and api.telegram.org are rewritten to the
+fake server at the transport-adapter level, so the monitors run unmodified.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from urllib.parse import urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+
+import logutil
+from metrics import CHECKS
+from bench.fake_shopee import FakeConfig, FakeShopee
+
+REDIRECT_HOSTS = {"shopee.co.id", "api.telegram.org"}
+VARIANTS = ("main-serial", "main-async", "main-batch", "github")
+
+
+@contextlib.contextmanager
+def redirect_to(base_url: str):
+    target = urlsplit(base_url)
+    original = HTTPAdapter.send
+
+    def send(self, request, *args, **kwargs):
+        parts = urlsplit(request.url)
+        if parts.hostname in REDIRECT_HOSTS:
+            request.url = urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+        return original(self, request, *args, **kwargs)
+
+    HTTPAdapter.send = send
+    try:
+        yield
+    finally:
+        HTTPAdapter.send = original
+
+
+class SleepRecorder:
+    """Stands in for the `time` module so fixed politeness sleeps are tallied, not slept."""
+
+    def __init__(self, real):
+        self._real = real
+        self.slept = 0.0
+
+    def sleep(self, seconds):
+        self.slept += seconds
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+def make_watchlist(size: int, shops: int) -> list[dict]:
+    return [{"shop_id": str(100000 + i % shops), "item_id": str(2000000 + i)} for i in range(size)]
+
+
+def bench_identities(count: int, base_url: str) -> list[dict] | None:
+    """`count` distinct clients: each header profile direct, then again via the fake server as proxy."""
+    from identity_pool import HEADER_PROFILES
+    if count <= 0:
+        return None
+    profiles = list(HEADER_PROFILES)
+    if count > 2 * len(profiles):
+        raise ValueError(f"at most {2 * len(profiles)} distinct bench identities")
+    return [{"name": f"id{i}", "profile": profiles[i % len(profiles)],
+             "proxy": None if i < len(profiles) else base_url} for i in range(count)]
+
+
+def run_main(variant: str, products: list[dict], passes: int, workdir: str, concurrency: int,
+             identities: list[dict] | None = None, host_rate: float = 0.0) -> list[float]:
+    import main
+    mode = "serial" if variant == "main-serial" else "async"
+    monitor = main.ShopeeMonitor(
+        "bench-token", "bench-chat",
+        state_file=os.path.join(workdir, "state.db"), state_backend="sqlite",
+        mode=mode, concurrency=concurrency,
+        batch_size=50 if variant == "main-batch" else 0,
+        cookie_file=os.path.join(workdir, "cookies.json"),
+        outbox_file=os.path.join(workdir, "outbox.json"),
+        identities=identities,
+        host_rates={"shopee.co.id": host_rate} if host_rate else None,
+        # Passes run back to back here; don't let the shared result cache answer the next one
+        result_ttl=0,
+    )
+    durations = []
+    for _ in range(passes):
+        started = time.perf_counter()
+        monitor.monitor_once(products)
+        durations.append(time.perf_counter() - started)
+    monitor.notifier.stop(timeout=30)
+    monitor.store.close()
+    return durations
+
+
+def run_github(products: list[dict], passes: int, workdir: str, sleeps: SleepRecorder) -> list[float]:
+    import shopee_bot_github
+    shopee_bot_github.time = sleeps
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    durations = []
+    try:
+        for _ in range(passes):
+            # Each pass is a fresh cron run, as on GitHub Actions
+            bot = shopee_bot_github.ShopeeMonitor("bench-token", "bench-chat",
+                                                  cookie_file="cookies.json", outbox_file="outbox.json")
+            started = time.perf_counter()
+            bot.monitor(products)
+            durations.append(time.perf_counter() - started)
+    finally:
+        os.chdir(cwd)
+        shopee_bot_github.time = sleeps._real
+    return durations
+
+
+def bench_one(fake: FakeShopee, variant: str, size: int, args) -> dict:
+    products = make_watchlist(size, args.shops)
+    fake.reset_counts()
+    failed_before = CHECKS.value("failed")
+    sleeps = SleepRecorder(time)
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        if args.tracemalloc:
+            tracemalloc.start()
+        with contextlib.redirect_stdout(devnull):
+            if variant == "github":
+                durations = run_github(products, args.passes, workdir, sleeps)
+            else:
+                durations = run_main(variant, products, args.passes, workdir, args.concurrency,
+                                     bench_identities(args.identities, fake.base_url), args.host_rate)
+            logutil.flush()
+        peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+    shopee_requests = sum(n for ep, n in fake.counts.items() if ep != "telegram")
+    total = sum(durations)
+    return {
+        "variant": variant,
+        "products": size,
+        "passes": args.passes,
+        "pass_mean_s": round(total / len(durations), 3),
+        "pass_max_s": round(max(durations), 3),
+        "products_per_s": round(size * len(durations) / total, 1) if total else None,
+        "requests_per_pass": round(shopee_requests / len(durations), 1),
+        "requests_per_product": round(shopee_requests / (size * len(durations)), 2),
+        "requests_by_endpoint": dict(fake.counts),
+        "clients": len(fake.clients),
+        "failed_per_pass": round((CHECKS.value("failed") - failed_before) / len(durations), 1),
+        "telegram_messages": len(fake.telegram_messages),
+        "skipped_sleep_s": round(sleeps.slept, 1),
+        "peak_mem_mb": round(peak / 1048576, 1) if peak is not None else None,
+    }
+
+
+def print_table(results: list[dict]):
+    cols = ["variant", "products", "pass_mean_s", "pass_max_s", "products_per_s",
+            "requests_per_pass", "requests_per_product", "failed_per_pass", "telegram_messages", "peak_mem_mb"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated watchlist sizes")
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--passes", type=int, default=3)
+    parser.add_argument("--shops", type=int, default=20, help="spread products over this many shops")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--forbidden-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--client-rps", type=float, default=0.0, help="fake per-client throttle, 0 = off")
+    parser.add_argument("--host-rate", type=float, default=0.0,
+                        help="per-client Shopee request rate for main variants, 0 = unlimited")
+    parser.add_argument("--identities", type=int, default=0, help="run main variants through this many identities")
+    parser.add_argument("--payload-kb", type=int, default=4)
+    parser.add_argument("--flip-rate", type=float, default=0.05)
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    config = FakeConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        forbidden_rate=args.forbidden_rate, throttle_rate=args.throttle_rate,
+                        payload_kb=args.payload_kb, flip_rate=args.flip_rate, client_rps=args.client_rps)
+    fake = FakeShopee(config)
+    base_url = fake.start()
+    results = []
+    try:
+        with redirect_to(base_url):
+            for size in (int(s) for s in args.sizes.split(",")):
+                for variant in args.variants.split(","):
+                    if variant not in VARIANTS:
+                        parser.error(f"unknown variant {variant!r}")
+                    result = bench_one(fake, variant, size, args)
+                    results.append(result)
+                    print(f"done {variant} x {size}: {result['pass_mean_s']}s/pass", file=sys.stderr)
+    finally:
+        fake.stop()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,220 @@
+"""Local stand-in for the Shopee endpoints and Telegram sendMessage.
+
+Every knob is a plain attribute on `FakeConfig` so a benchmark can change
+latency or failure rates between runs without restarting the server.
+"""
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+_PRODUCT_PATH = re.compile(r"^/product/(\d+)/(\d+)$")
+_TELEGRAM_PATH = re.compile(r"^/bot[^/]*/(\w+)$")
+
+
+class FakeConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 forbidden_rate: float = 0.0, throttle_rate: float = 0.0, payload_kb: int = 4,
+                 flip_rate: float = 0.05, models_per_item: int = 3, client_rps: float = 0.0,
+                 seed: int = 1234):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.forbidden_rate = forbidden_rate
+        self.throttle_rate = throttle_rate
+        self.payload_kb = payload_kb
+        self.flip_rate = flip_rate
+        self.models_per_item = models_per_item
+        # Per-client throttle (0 = off); a client is a User-Agent plus whether it came via a proxy
+        self.client_rps = client_rps
+        self.rng = random.Random(seed)
+
+
+class FakeShopee:
+    """Owns the fake catalogue and request counters shared by all handler threads."""
+
+    def __init__(self, config: FakeConfig | None = None):
+        self.config = config or FakeConfig()
+        self.counts: Counter = Counter()
+        self.telegram_messages: list[str] = []
+        self.telegram_replies: list[tuple[str, str]] = []
+        self._updates: list[dict] = []
+        self.clients: Counter = Counter()
+        self._windows: dict[str, tuple[int, int]] = {}
+        self._stock: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    # ----- catalogue -----
+    def item(self, shop_id: str, item_id: str) -> dict:
+        cfg = self.config
+        key = (str(shop_id), str(item_id))
+        with self._lock:
+            stock = self._stock.get(key)
+            if stock is None:
+                stock = cfg.rng.choice([0, 0, 2, 5, 20])
+            elif cfg.rng.random() < cfg.flip_rate:
+                stock = 0 if stock else cfg.rng.choice([1, 3, 10])
+            self._stock[key] = stock
+        models = [
+            {"modelid": int(item_id) * 10 + m, "name": f"Variant {m}",
+             "stock": stock if m == 0 else max(0, stock - m), "price": 1500000000 + m * 100000}
+            for m in range(cfg.models_per_item)
+        ]
+        return {
+            "itemid": int(item_id), "shopid": int(shop_id), "name": f"Produk {item_id}",
+            "price": 1500000000, "stock": stock, "models": models,
+            # Padding stands in for descriptions, images and the rest of the real payload
+            "description": "x" * (cfg.payload_kb * 1024),
+        }
+
+    # ----- server lifecycle -----
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; don't let Nagle stall them
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake._handle(self, "GET")
+
+            def do_POST(self):
+                fake._handle(self, "POST")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-shopee", daemon=True).start()
+        return self.base_url
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts.clear()
+            self.telegram_messages.clear()
+            self.telegram_replies.clear()
+            self.clients.clear()
+            self._windows.clear()
+
+    def push_update(self, text: str, chat_id: str = "bench-chat"):
+        """Queue an incoming bot message for the next getUpdates call."""
+        with self._lock:
+            update_id = (self._updates[-1]["update_id"] + 1) if self._updates else 1
+            self._updates.append({"update_id": update_id,
+                                  "message": {"chat": {"id": chat_id}, "text": text}})
+
+    def _get_updates(self, query: dict) -> bytes:
+        offset = int(query.get("offset", 0))
+        # Short long-poll so tests don't have to wait out the client's timeout
+        deadline = time.monotonic() + min(float(query.get("timeout", 0)), 1.0)
+        while True:
+            with self._lock:
+                pending = [u for u in self._updates if u["update_id"] >= offset]
+            if pending or time.monotonic() >= deadline:
+                return json.dumps({"ok": True, "result": pending}).encode()
+            time.sleep(0.05)
+
+    # ----- request handling -----
+    def _reply(self, handler, status: int, body: bytes, content_type: str = "application/json",
+               headers: dict | None = None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _over_client_rate(self, client: str) -> bool:
+        # Fixed one-second windows per client, like a simple per-IP throttle
+        with self._lock:
+            self.clients[client] += 1
+            if not self.config.client_rps:
+                return False
+            second = int(time.monotonic())
+            start, count = self._windows.get(client, (second, 0))
+            if start != second:
+                start, count = second, 0
+            self._windows[client] = (start, count + 1)
+            return count + 1 > self.config.client_rps
+
+    def _handle(self, handler, method: str):
+        url = urlsplit(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length) if length else b""
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        tg = _TELEGRAM_PATH.match(url.path)
+        if tg:
+            with self._lock:
+                self.counts["telegram"] += 1
+            if tg.group(1) == "getUpdates":
+                return self._reply(handler, 200, self._get_updates(query))
+            if tg.group(1) == "sendMessage":
+                try:
+                    body = json.loads(raw or b"{}")
+                    self.telegram_messages.append(body.get("text", ""))
+                    self.telegram_replies.append((str(body.get("chat_id")), body.get("text", "")))
+                except ValueError:
+                    pass
+            return self._reply(handler, 200, b'{"ok":true,"result":{}}')
+
+        endpoint = url.path if not _PRODUCT_PATH.match(url.path) else "/product"
+        with self._lock:
+            self.counts[endpoint] += 1
+        cfg = self.config
+        # Requests sent through a proxy arrive in absolute form ("http://host/path")
+        client = f"{handler.headers.get('User-Agent', '')}|{'proxy' if handler.path.startswith('http') else 'direct'}"
+        if self._over_client_rate(client):
+            return self._reply(handler, 429, b'{"error":"too many requests"}', headers={"Retry-After": "1"})
+        if cfg.latency_ms or cfg.jitter_ms:
+            time.sleep(max(0.0, cfg.latency_ms + cfg.rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000)
+        roll = cfg.rng.random()
+        if roll < cfg.forbidden_rate:
+            return self._reply(handler, 403, b'{"error":90309999}')
+        if roll < cfg.forbidden_rate + cfg.throttle_rate:
+            return self._reply(handler, 429, b'{"error":"too many requests"}', headers={"Retry-After": "1"})
+        if roll < cfg.forbidden_rate + cfg.throttle_rate + cfg.error_rate:
+            return self._reply(handler, 500, b'{"error":"internal"}')
+
+        if url.path == "/":
+            return self._reply(handler, 200, b"<html>home</html>", "text/html",
+                               headers={"Set-Cookie": "SPC_F=fake; Path=/; Max-Age=3600"})
+        if url.path == "/api/v4/item/get":
+            item = self.item(query.get("shopid", "0"), query.get("itemid", "0"))
+            return self._reply(handler, 200, json.dumps({"error": None, "data": item}).encode())
+        if url.path == "/api/v4/pdp/get_pc":
+            item = self.item(query.get("shop_id", "0"), query.get("item_id", "0"))
+            return self._reply(handler, 200, json.dumps({"item": item}).encode())
+        if url.path == "/api/v4/item/get_list" and method == "POST":
+            ids = json.loads(raw or b"{}").get("shop_item_ids", [])
+            items = [self.item(x["shopid"], x["itemid"]) for x in ids]
+            return self._reply(handler, 200, json.dumps({"data": items}).encode())
+        if url.path == "/api/v4/shop/search_items":
+            return self._reply(handler, 200, json.dumps({"items": []}).encode())
+        product = _PRODUCT_PATH.match(url.path)
+        if product:
+            item = self.item(*product.groups())
+            item["models"] = {str(m["modelid"]): m for m in item["models"]}
+            state = json.dumps({"item": item})
+            page = (f"<html><head><script>window.__INITIAL_STATE__={state};</script></head>"
+                    f"<body>{'<div></div>' * 2000}</body></html>")
+            return self._reply(handler, 200, page.encode(), "text/html")
+        return self._reply(handler, 404, b'{"error":"not found"}')
@@ -0,0 +1,54 @@
+import os
+import json
+import time
+
+from logutil import log
+from decoding import ItemRecord
+
+CHECKPOINT_VERSION = 1
+
+
+def encode_cached(value):
+    """Response-cache values are an ItemRecord, or {item_id: ItemRecord} for batch chunks."""
+    if isinstance(value, ItemRecord):
+        return {"r": value.to_list()}
+    return {"b": {item_id: record.to_list() for item_id, record in value.items()}}
+
+
+def decode_cached(data):
+    if "r" in data:
+        return ItemRecord.from_list(data["r"])
+    return {item_id: ItemRecord.from_list(row) for item_id, row in data["b"].items()}
+
+
+def save_checkpoint(path: str, data: dict):
+    """Write `data` plus a timestamp via tmp + rename, so a kill mid-write keeps the old one."""
+    payload = {"version": CHECKPOINT_VERSION, "saved_at": time.time(), **data}
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except Exception as e:
+        log("warning", "Failed saving checkpoint", path=path, error=str(e))
+
+
+def load_checkpoint(path: str, max_age: float) -> dict | None:
+    """The saved checkpoint, or None if missing, unreadable or older than `max_age` seconds."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except Exception as e:
+        log("warning", "Failed loading checkpoint", path=path, error=str(e))
+        return None
+    if data.get("version") != CHECKPOINT_VERSION:
+        log("info", "Checkpoint version mismatch, starting cold", found=data.get("version"))
+        return None
+    age = time.time() - data.get("saved_at", 0)
+    if age > max_age:
+        log("info", "Checkpoint too old, starting cold", age_seconds=round(age))
+        return None
+    data["age"] = max(0.0, age)
+    return data
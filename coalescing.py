@@ -0,0 +1,76 @@
+import time
+import threading
+from concurrent.futures import Future
+
+from metrics import RESULT_SHARING
+
+# ========= Shared Product Results =========
+class ResultCoalescer:
+    """Single-flight, short-TTL front for a blocking `fetch(shop_id, item_id)`.
+
+    Callers asking for a product that is already being fetched wait for that
+    fetch instead of starting their own. A successful result is then served
+    to anyone else for `ttl` seconds. Failures are shared with the callers
+    already waiting but are not cached.
+    """
+
+    def __init__(self, fetch, ttl: float = 15.0, max_entries: int = 50000, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._results: dict[str, tuple[float, dict]] = {}
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.shared = 0
+        self.cached = 0
+
+    def get(self, shop_id: str, item_id: str) -> dict | None:
+        key = f"{shop_id}_{item_id}"
+        with self._lock:
+            hit = self._results.get(key)
+            if hit is not None and self.clock() - hit[0] <= self.ttl:
+                self.cached += 1
+                RESULT_SHARING.inc("cached")
+                return hit[1]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.fetched += 1
+            else:
+                self.shared += 1
+        if not leader:
+            RESULT_SHARING.inc("shared")
+            return future.result()
+
+        RESULT_SHARING.inc("fetched")
+        info = None
+        try:
+            info = self.fetch(shop_id, item_id)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if info:
+                    self._store(key, info)
+            future.set_result(info)
+        return info
+
+    def prime(self, key: str, info: dict):
+        """Cache a result obtained elsewhere (e.g. a batch lookup)."""
+        with self._lock:
+            self._store(key, info)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._results.pop(key, None)
+
+    def _store(self, key: str, info: dict):
+        self._results[key] = (self.clock(), info)
+        if len(self._results) > self.max_entries:
+            cutoff = self.clock() - self.ttl
+            self._results = {k: v for k, v in self._results.items() if v[0] >= cutoff}
+
+    def summary(self) -> dict:
+        return {"fetched": self.fetched, "shared": self.shared, "cached": self.cached}
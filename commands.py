@@ -0,0 +1,316 @@
+import re
+import html
+import time
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from logutil import log
+from batching import product_key
+from watchlist import DEFAULT_CHAT, subscribers
+from metrics import BOT_COMMANDS
+
+STATUS_MAX_LINES = 40
+
+_REF_PATTERNS = (
+    re.compile(r"/product/(\d+)/(\d+)"),          # https://shopee.co.id/product/<shop>/<item>
+    re.compile(r"-i\.(\d+)\.(\d+)"),              # https://shopee.co.id/<slug>-i.<shop>.<item>
+    re.compile(r"^(\d+)[\s/_.:-]+(\d+)$"),        # "<shop> <item>", "<shop>_<item>", ...
+)
+
+
+def parse_product_ref(text: str) -> tuple[str | None, str] | None:
+    """Pull (shop_id, item_id) out of a Shopee URL or id pair; a lone item id gives (None, item_id)."""
+    text = (text or "").strip()
+    for pattern in _REF_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            return m.group(1), m.group(2)
+    if text.isdigit():
+        return None, text
+    return None
+
+
+def _wib(ts: float) -> str:
+    return (datetime.utcfromtimestamp(ts) + timedelta(hours=7)).strftime("%d/%m %H:%M")
+
+
+def _age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{int(seconds)}d lalu"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m lalu"
+    return f"{int(seconds // 3600)}j lalu"
+
+# ========= Telegram Bot Commands =========
+class TelegramCommands:
+    """Answers bot commands from a `getUpdates` long-poll loop on its own thread.
+
+    /status and /check are served from the monitor's in-memory snapshots;
+    /check only fetches when the snapshot is missing or older than
+    `check_max_age`, and concurrent checks of one product share a single
+    fetch. /add and /remove subscribe or unsubscribe the asking chat in the
+    watchlist, which the monitor loop picks up on its next poll; a product
+    goes once its last subscriber leaves. Only chats in `allowed_chats` are
+    answered. Replies go through the monitor's dispatcher, bypassing digest
+    collection.
+    """
+
+    def __init__(self, monitor, api_base: str, allowed_chats, poll_timeout: int = 30,
+                 check_max_age: float = 60.0, check_workers: int = 2,
+                 session: requests.Session | None = None):
+        self.monitor = monitor
+        self.api_base = api_base
+        self.allowed_chats = {str(c) for c in allowed_chats if str(c)}
+        self.poll_timeout = poll_timeout
+        self.check_max_age = check_max_age
+        self.session = session or requests.Session()
+        self.handlers = {
+            "/start": self.cmd_help, "/help": self.cmd_help,
+            "/status": self.cmd_status, "/check": self.cmd_check,
+            "/add": self.cmd_add, "/remove": self.cmd_remove,
+        }
+        self._offset: int | None = None
+        self._inflight: dict[str, list[str]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=check_workers, thread_name_prefix="bot-check")
+        self._thread: threading.Thread | None = None
+
+    # ----- lifecycle -----
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telegram-commands", daemon=True)
+        self._thread.start()
+        log("info", "Bot commands started", allowed_chats=len(self.allowed_chats))
+
+    def stop(self, timeout: float = 5.0):
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._offset is not None:
+            # Acknowledge what we handled so a restart doesn't replay it
+            try:
+                self.session.get(f"{self.api_base}/getUpdates",
+                                 params={"offset": self._offset, "timeout": 0, "limit": 1}, timeout=timeout)
+            except Exception as e:
+                log("warning", "Bot update ack failed", error=str(e))
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        failures = 0
+        while not self._stopped.is_set():
+            params = {"timeout": self.poll_timeout, "allowed_updates": '["message"]'}
+            if self._offset is not None:
+                params["offset"] = self._offset
+            try:
+                resp = self.session.get(f"{self.api_base}/getUpdates", params=params,
+                                        timeout=self.poll_timeout + 10)
+                data = resp.json()
+                if resp.status_code != 200 or not data.get("ok"):
+                    raise RuntimeError(f"getUpdates {resp.status_code}: {str(data)[:200]}")
+                failures = 0
+            except Exception as e:
+                failures += 1
+                log("warning", "Bot getUpdates failed", error=str(e), failures=failures)
+                self._stopped.wait(min(60, 2 ** failures))
+                continue
+            for update in data.get("result") or []:
+                self._offset = update["update_id"] + 1
+                try:
+                    self.handle_update(update)
+                except Exception as e:
+                    log("error", "Bot command failed", error=str(e), update_id=update.get("update_id"))
+
+    # ----- dispatch -----
+    def reply(self, chat_id: str, text: str):
+        self.monitor.notifier.enqueue(text, chat_id=chat_id, hold=False)
+
+    def handle_update(self, update: dict):
+        message = update.get("message") or {}
+        text = (message.get("text") or "").strip()
+        chat_id = str((message.get("chat") or {}).get("id", ""))
+        if not text.startswith("/") or not chat_id:
+            return
+        command, _, args = text.partition(" ")
+        command = command.split("@", 1)[0].lower()
+        handler = self.handlers.get(command)
+        if chat_id not in self.allowed_chats:
+            BOT_COMMANDS.inc(command if handler else "unknown", "denied")
+            log("warning", "Bot command from unknown chat ignored", chat_id=chat_id, command=command)
+            return
+        if handler is None:
+            BOT_COMMANDS.inc("unknown", "ok")
+            self.reply(chat_id, "Perintah tidak dikenal. Ketik /help.")
+            return
+        log("info", "Bot command", chat_id=chat_id, command=command, args=args.strip())
+        handler(chat_id, args.strip())
+
+    def _resolve(self, ref: str, watched_only: bool = False) -> dict | None:
+        parsed = parse_product_ref(ref)
+        if parsed is None:
+            return None
+        shop_id, item_id = parsed
+        for product in self.monitor.products:
+            if product["item_id"] == item_id and (shop_id is None or product["shop_id"] == shop_id):
+                return product
+        if shop_id is None or watched_only:
+            return None
+        return {"shop_id": shop_id, "item_id": item_id}
+
+    # ----- commands -----
+    def cmd_help(self, chat_id: str, args: str):
+        BOT_COMMANDS.inc("/help", "ok")
+        self.reply(chat_id,
+                   "🤖 <b>Perintah</b>\n\n"
+                   "/status - ringkasan produk yang kamu pantau\n"
+                   "/check &lt;item_id | link&gt; - stok &amp; harga terkini\n"
+                   "/add &lt;link | shop_id item_id&gt; - pantau produk\n"
+                   "/remove &lt;item_id | link&gt; - berhenti memantau")
+
+    def cmd_status(self, chat_id: str, args: str):
+        default_chat = self.monitor.telegram_chat_id
+        products = [p for p in self.monitor.products if chat_id in subscribers(p, default_chat)]
+        now = time.time()
+        lines = [f"📋 <b>STATUS MONITOR</b> ({len(products)} produk)", ""]
+        available = 0
+        for i, product in enumerate(products):
+            snap = self.monitor.snapshots.get(product_key(product))
+            if snap is not None and snap["available"]:
+                available += 1
+            if i >= STATUS_MAX_LINES:
+                continue
+            if snap is None:
+                lines.append(f"⏳ {product_key(product)} - belum dicek")
+            else:
+                lines.append(f"{'✅' if snap['available'] else '❌'} {html.escape(snap['name'][:40])} - "
+                             f"stok {snap['stock']}, Rp {snap['price']:,.0f} "
+                             f"({_age(now - snap['checked_at'])})")
+        if len(products) > STATUS_MAX_LINES:
+            lines.append(f"… dan {len(products) - STATUS_MAX_LINES} produk lainnya")
+        lines += ["", f"Tersedia: {available}/{len(products)}", f"🕐 {self.monitor.get_wib_time()} WIB"]
+        BOT_COMMANDS.inc("/status", "ok")
+        self.reply(chat_id, "\n".join(lines))
+
+    def cmd_add(self, chat_id: str, args: str):
+        parsed = parse_product_ref(args)
+        if parsed is None or parsed[0] is None:
+            BOT_COMMANDS.inc("/add", "invalid")
+            self.reply(chat_id, "Format: /add &lt;link produk&gt; atau /add &lt;shop_id&gt; &lt;item_id&gt;")
+            return
+        self._edit_watchlist(chat_id, "/add", {"shop_id": parsed[0], "item_id": parsed[1]})
+
+    def cmd_remove(self, chat_id: str, args: str):
+        product = self._resolve(args, watched_only=True)
+        if product is None:
+            BOT_COMMANDS.inc("/remove", "invalid")
+            self.reply(chat_id, "Produk tidak ada di daftar pantauan.")
+            return
+        self._edit_watchlist(chat_id, "/remove", product)
+
+    def _edit_watchlist(self, chat_id: str, command: str, product: dict):
+        watchlist = self.monitor.watchlist
+        key = product_key(product)
+        if watchlist is None:
+            BOT_COMMANDS.inc(command, "unavailable")
+            self.reply(chat_id, "Watchlist tidak aktif (WATCHLIST_FILE belum diatur).")
+            return
+        default_chat = self.monitor.telegram_chat_id
+        me = DEFAULT_CHAT if chat_id == default_chat else chat_id
+        current = next((p for p in watchlist.products() if product_key(p) == key), None)
+        try:
+            if command == "/add":
+                if current is None:
+                    changed = watchlist.add(product if me == DEFAULT_CHAT else {**product, "chats": [me]})
+                elif chat_id in subscribers(current, default_chat):
+                    changed = False
+                else:
+                    changed = watchlist.add({**current, "chats": [*current.get("chats", [DEFAULT_CHAT]), me]})
+            else:
+                chats = subscribers(current, default_chat) if current is not None else []
+                if chat_id not in chats:
+                    changed = False
+                elif len(chats) == 1:
+                    changed = watchlist.remove(key)
+                else:
+                    remaining = [c for c in current.get("chats", [DEFAULT_CHAT])
+                                 if c not in (me, chat_id)]
+                    changed = watchlist.add({**current, "chats": remaining})
+        except ValueError as e:
+            BOT_COMMANDS.inc(command, "unavailable")
+            self.reply(chat_id, f"Gagal: {html.escape(str(e))}")
+            return
+        BOT_COMMANDS.inc(command, "ok" if changed else "noop")
+        if command == "/add":
+            text = (f"➕ Ditambahkan: {key}\nAkan dicek pada putaran berikutnya." if changed
+                    else f"{key} sudah dipantau.")
+        else:
+            text = f"➖ Berhenti memantau {key}" if changed else f"{key} tidak ada di daftar pantauanmu."
+        self.reply(chat_id, text)
+
+    def cmd_check(self, chat_id: str, args: str):
+        product = self._resolve(args)
+        if product is None:
+            BOT_COMMANDS.inc("/check", "invalid")
+            self.reply(chat_id, "Format: /check &lt;item_id&gt; atau /check &lt;link produk&gt;")
+            return
+        key = product_key(product)
+        snap = self.monitor.snapshots.get(key)
+        if snap is not None and time.time() - snap["checked_at"] <= self.check_max_age:
+            BOT_COMMANDS.inc("/check", "cached")
+            self.reply(chat_id, self._format_check(product, snap))
+            return
+        with self._lock:
+            waiters = self._inflight.get(key)
+            if waiters is not None:
+                # Someone already asked; ride along on that fetch
+                waiters.append(chat_id)
+                BOT_COMMANDS.inc("/check", "coalesced")
+                return
+            self._inflight[key] = [chat_id]
+        self._executor.submit(self._run_check, product)
+
+    def _run_check(self, product: dict):
+        key = product_key(product)
+        info = None
+        try:
+            info = self.monitor.results.get(product["shop_id"], product["item_id"])
+            # This fetch never reaches the state store, so it must not leave validators behind
+            # for the next pass to answer "unchanged" from
+            for method in self.monitor.fetch_methods:
+                self.monitor.response_cache.discard(f"{method}:{key}")
+            if info:
+                self.monitor.record_snapshot(key, info)
+        except Exception as e:
+            log("error", "On-demand check failed", key=key, error=str(e))
+        finally:
+            with self._lock:
+                waiters = self._inflight.pop(key, [])
+        BOT_COMMANDS.inc("/check", "fetched" if info else "failed")
+        snap = self.monitor.snapshots.get(key) if info else None
+        text = (self._format_check(product, snap) if snap is not None
+                else f"⚠️ Gagal mengecek {key}, coba lagi nanti.")
+        for chat_id in dict.fromkeys(waiters):
+            self.reply(chat_id, text)
+
+    def _format_check(self, product: dict, snap: dict) -> str:
+        key = product_key(product)
+        lines = [
+            f"{'✅' if snap['available'] else '❌'} <b>{html.escape(snap['name'])}</b>",
+            f"💰 Rp {snap['price']:,.0f}",
+            f"📊 Stok: {snap['stock']} unit",
+            f"🕐 Dicek {_age(time.time() - snap['checked_at'])}",
+        ]
+        history = self.monitor.history
+        if history is not None:
+            changes = history.last_changes(key, 1)
+            if changes:
+                before, after = changes[0]
+                lines.append(f"↕️ Terakhir berubah {_wib(after.ts)} WIB: stok {before.stock} → {after.stock}, "
+                             f"Rp {before.price:,.0f} → {after.price:,.0f}")
+        if key not in {product_key(p) for p in self.monitor.products}:
+            lines.append("(tidak dipantau - /add untuk memantau)")
+        lines.append(f"🔗 <a href='https://shopee.co.id/product/{product['shop_id']}/{product['item_id']}'>"
+                     f"Lihat Produk</a>")
+        return "\n".join(lines)
@@ -0,0 +1,74 @@
+import json
+
+from variants import models_from_item
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib decoder is the fallback
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(body: bytes | str):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def decode_response(resp):
+    """Decode a response body straight from bytes.
+
+    Skips `resp.json()`, which decodes the body to `str` (guessing the
+    charset when the server didn't send one) before parsing.
+    """
+    return loads(resp.content)
+
+# ========= Projected Item Record =========
+class ItemRecord:
+    """The handful of item fields the monitor uses, without the rest of the payload."""
+    __slots__ = ("name", "stock", "price", "models")
+
+    def __init__(self, name: str, stock: int, price: float, models: tuple):
+        self.name = name
+        self.stock = stock
+        self.price = price
+        self.models = models
+
+    @classmethod
+    def from_item(cls, item: dict) -> "ItemRecord":
+        raw_price = item.get("price", 0)
+        return cls(
+            item.get("name", "Unknown"),
+            item.get("stock", 0) or 0,
+            (raw_price / 100000) if isinstance(raw_price, (int, float)) else 0,
+            tuple(models_from_item(item)),
+        )
+
+    def to_list(self) -> list:
+        return [self.name, self.stock, self.price, [list(m) for m in self.models]]
+
+    @classmethod
+    def from_list(cls, row: list) -> "ItemRecord":
+        name, stock, price, models = row
+        return cls(name, stock, price, tuple(tuple(m) for m in models))
+
+    def info(self, source: str) -> dict:
+        return {
+            "name": self.name,
+            "stock": self.stock,
+            "price": self.price,
+            "available": self.stock > 0,
+            "source": source,
+            "models": self.models,
+        }
+
+
+def project_item(payload, container: str) -> ItemRecord | None:
+    """Pick `payload[container]` (e.g. "data" for /item/get, "item" for /pdp/get_pc) as a record."""
+    if not isinstance(payload, dict):
+        return None
+    item = payload.get(container)
+    if not isinstance(item, dict) or not item:
+        return None
+    return ItemRecord.from_item(item)
@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import zlib
+import threading
+from array import array
+from datetime import datetime, timezone
+
+from logutil import log
+
+LOG_SUFFIX = ".log"
+COLUMN_SUFFIX = ".col"
+COLUMN_MAGIC = b"SHH1"
+
+
+def _day_of(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _day_start(day: str) -> int:
+    return int(datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+def _put_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+class HistoryPoint:
+    __slots__ = ("ts", "stock", "price")
+
+    def __init__(self, ts: int, stock: int, price: float):
+        self.ts = ts
+        self.stock = stock
+        self.price = price
+
+    def as_dict(self) -> dict:
+        return {"ts": self.ts, "stock": self.stock, "price": self.price}
+
+
+class _Series:
+    """One product's samples for one day as parallel typed columns."""
+    __slots__ = ("ts", "stock", "price")
+
+    def __init__(self):
+        self.ts = array("q")
+        self.stock = array("q")
+        self.price = array("q")
+
+    def append(self, ts: int, stock: int, price_cents: int):
+        self.ts.append(ts)
+        self.stock.append(stock)
+        self.price.append(price_cents)
+
+    def points(self) -> list[HistoryPoint]:
+        return [HistoryPoint(t, s, p / 100) for t, s, p in zip(self.ts, self.stock, self.price)]
+
+    def encode(self) -> bytes:
+        # Deltas turn a mostly-flat series into runs of zeros, which zlib crushes
+        cols = array("q")
+        for col in (self.ts, self.stock, self.price):
+            prev = 0
+            for value in col:
+                cols.append(value - prev)
+                prev = value
+        return zlib.compress(cols.tobytes(), 6)
+
+    @classmethod
+    def decode(cls, blob: bytes, count: int) -> "_Series":
+        cols = array("q")
+        cols.frombytes(zlib.decompress(blob))
+        series = cls()
+        for idx, col in enumerate((series.ts, series.stock, series.price)):
+            prev = 0
+            for delta in cols[idx * count:(idx + 1) * count]:
+                prev += delta
+                col.append(prev)
+        return series
+
+
+def _read_log(path: str) -> dict[str, _Series]:
+    """Replay a day log; a torn trailing row from a crash is ignored."""
+    with open(path, "rb") as f:
+        buf = f.read()
+    keys: list[str] = []
+    last: list[list[int]] = []
+    series: dict[str, _Series] = {}
+    pos = 0
+    while pos < len(buf):
+        try:
+            slot, p = _get_varint(buf, pos)
+            if slot == 0:
+                # Key definition: takes the next slot number
+                length, p = _get_varint(buf, p)
+                if p + length > len(buf):
+                    break
+                keys.append(buf[p:p + length].decode())
+                last.append([0, 0, 0])
+                pos = p + length
+                continue
+            values = []
+            for _ in range(3):
+                v, p = _get_varint(buf, p)
+                values.append(_unzigzag(v))
+        except IndexError:
+            break
+        state = last[slot - 1]
+        for i in range(3):
+            state[i] += values[i]
+        series.setdefault(keys[slot - 1], _Series()).append(*state)
+        pos = p
+    return series
+
+
+def _write_columns(path: str, series: dict[str, _Series], downsampled: bool = False):
+    index = {}
+    blocks = []
+    offset = 0
+    for key, s in series.items():
+        blob = s.encode()
+        index[key] = [offset, len(blob), len(s.ts)]
+        blocks.append(blob)
+        offset += len(blob)
+    header = json.dumps({"downsampled": downsampled, "index": index}, separators=(",", ":")).encode()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(COLUMN_MAGIC)
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        for blob in blocks:
+            f.write(blob)
+    os.replace(tmp, path)
+
+
+def _read_header(f) -> tuple[dict, int]:
+    if f.read(4) != COLUMN_MAGIC:
+        raise ValueError("not a history column file")
+    length = int.from_bytes(f.read(4), "little")
+    return json.loads(f.read(length)), 8 + length
+
+
+def _downsample(s: _Series, bucket: int) -> _Series:
+    """Keep every change point plus the first sample of each `bucket` seconds."""
+    out = _Series()
+    last_bucket = None
+    prev = None
+    for t, st, p in zip(s.ts, s.stock, s.price):
+        b = t // bucket
+        if prev is None or (st, p) != prev or b != last_bucket:
+            out.append(t, st, p)
+            last_bucket = b
+        prev = (st, p)
+    return out
+
+# ========= Price/Stock Time Series =========
+class HistoryStore:
+    """Append-only price/stock history, one file per UTC day.
+
+    Today's samples go straight to `<day>.log` as varint rows, each
+    delta-encoded against the product's previous row (an unchanged sample
+    is ~5 bytes); only that previous row is kept in memory.
+    Closed days are compacted into `<day>.col`: a JSON index of per-product
+    blocks, each a zlib'd set of delta columns, so a query reads only the
+    blocks for the product it asks about. Days older than
+    `downsample_after_days` keep change points plus one sample per
+    `downsample_bucket`; days past `retention_days`, or the oldest ones
+    beyond `max_bytes`, are deleted.
+    """
+
+    def __init__(self, directory: str, retention_days: int = 90, max_bytes: int = 200 * 1024 * 1024,
+                 downsample_after_days: int = 7, downsample_bucket: int = 3600, clock=time.time):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.downsample_after_days = downsample_after_days
+        self.downsample_bucket = downsample_bucket
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._day = None
+        self._file = None
+        self._slots: dict[str, int] = {}
+        self._last: dict[str, list[int]] = {}
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._open_day(_day_of(self.clock()))
+        self.maintain()
+
+    # ----- writing -----
+    def _open_day(self, day: str):
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, day + LOG_SUFFIX)
+        existing = _read_log(path) if os.path.exists(path) else {}
+        # Rewrite so slots and delta state restart from a clean, fully-readable log
+        buf = bytearray()
+        self._slots = {}
+        self._last = {}
+        for key, s in existing.items():
+            for t, st, p in zip(s.ts, s.stock, s.price):
+                self._encode_row(buf, key, t, st, p)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf)
+        os.replace(tmp, path)
+        self._file = open(path, "ab")
+        self._day = day
+
+    def _encode_row(self, buf: bytearray, key: str, ts: int, stock: int, price_cents: int):
+        slot = self._slots.get(key)
+        if slot is None:
+            raw = key.encode()
+            buf.append(0)
+            _put_varint(buf, len(raw))
+            buf += raw
+            slot = self._slots[key] = len(self._slots) + 1
+            self._last[key] = [0, 0, 0]
+        last = self._last[key]
+        _put_varint(buf, slot)
+        for i, value in enumerate((ts, stock, price_cents)):
+            _put_varint(buf, _zigzag(value - last[i]))
+            last[i] = value
+
+    def record_many(self, samples):
+        """Append (key, stock, price_rp) samples taken now."""
+        now = self.clock()
+        day = _day_of(now)
+        ts = int(now)
+        with self._lock:
+            if day != self._day:
+                self._open_day(day)
+                self.maintain()
+            buf = bytearray()
+            for key, stock, price in samples:
+                cents = int(round((price or 0) * 100))
+                stock = int(stock or 0)
+                self._encode_row(buf, key, ts, stock, cents)
+            if buf:
+                self._file.write(buf)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._day = None
+
+    # ----- maintenance -----
+    def _files(self) -> list[tuple[str, str]]:
+        out = []
+        for name in os.listdir(self.directory):
+            day, ext = os.path.splitext(name)
+            if ext in (LOG_SUFFIX, COLUMN_SUFFIX) and len(day) == 10:
+                out.append((day, name))
+        return sorted(out)
+
+    def _compact_closed_days(self):
+        for day, name in self._files():
+            if name.endswith(LOG_SUFFIX) and day != self._day:
+                path = os.path.join(self.directory, name)
+                try:
+                    _write_columns(os.path.join(self.directory, day + COLUMN_SUFFIX), _read_log(path))
+                    os.remove(path)
+                    log("info", "History day compacted", day=day)
+                except Exception as e:
+                    log("warning", "History compaction failed", day=day, error=str(e))
+
+    def maintain(self):
+        """Compact closed days, downsample old ones and enforce retention and the size cap."""
+        with self._lock:
+            self._compact_closed_days()
+            now = self.clock()
+            today_start = _day_start(_day_of(now))
+            for day, name in self._files():
+                if not name.endswith(COLUMN_SUFFIX):
+                    continue
+                path = os.path.join(self.directory, name)
+                age_days = (today_start - _day_start(day)) // 86400
+                if age_days > self.retention_days:
+                    os.remove(path)
+                    log("info", "History day expired", day=day)
+                elif age_days > self.downsample_after_days:
+                    self._downsample_file(path)
+            files = self._files()
+            sizes = {name: os.path.getsize(os.path.join(self.directory, name)) for _, name in files}
+            total = sum(sizes.values())
+            for day, name in files:
+                if total <= self.max_bytes or day == self._day:
+                    break
+                os.remove(os.path.join(self.directory, name))
+                total -= sizes[name]
+                log("warning", "History day dropped for disk budget", day=day, max_bytes=self.max_bytes)
+
+    def _downsample_file(self, path: str):
+        with open(path, "rb") as f:
+            header, base = _read_header(f)
+            if header.get("downsampled"):
+                return
+            series = {}
+            for key, (offset, length, count) in header["index"].items():
+                f.seek(base + offset)
+                series[key] = _downsample(_Series.decode(f.read(length), count), self.downsample_bucket)
+        _write_columns(path, series, downsampled=True)
+
+    # ----- queries -----
+    def _day_series(self, day: str, key: str) -> _Series | None:
+        if day == self._day:
+            if key not in self._slots:
+                return None
+            # Today lives only in the log; make sure everything written so far is readable
+            self._file.flush()
+        col = os.path.join(self.directory, day + COLUMN_SUFFIX)
+        if os.path.exists(col):
+            with open(col, "rb") as f:
+                header, base = _read_header(f)
+                entry = header["index"].get(key)
+                if entry is None:
+                    return None
+                offset, length, count = entry
+                f.seek(base + offset)
+                return _Series.decode(f.read(length), count)
+        path = os.path.join(self.directory, day + LOG_SUFFIX)
+        if os.path.exists(path):
+            return _read_log(path).get(key)
+        return None
+
+    def _days(self, since: float | None = None, until: float | None = None) -> list[str]:
+        days = sorted({day for day, _ in self._files()} | ({self._day} if self._day else set()))
+        lo = _day_of(since) if since is not None else None
+        hi = _day_of(until) if until is not None else None
+        return [d for d in days if (lo is None or d >= lo) and (hi is None or d <= hi)]
+
+    def price_history(self, key: str, since: float | None = None,
+                      until: float | None = None) -> list[HistoryPoint]:
+        """Samples for one product, oldest first, reading only the days in range."""
+        out = []
+        with self._lock:
+            for day in self._days(since, until):
+                series = self._day_series(day, key)
+                if series is None:
+                    continue
+                for point in series.points():
+                    if (since is None or point.ts >= since) and (until is None or point.ts <= until):
+                        out.append(point)
+        return out
+
+    def last_changes(self, key: str, n: int = 10,
+                     max_days: int = 30) -> list[tuple[HistoryPoint, HistoryPoint]]:
+        """Up to `n` most recent (before, after) pairs where stock or price moved, newest first.
+
+        Walks days backwards and stops as soon as `n` changes are found, or
+        after `max_days` days so a product that never moves doesn't read them all.
+        """
+        changes = []
+        carry = None
+        with self._lock:
+            for day in reversed(self._days()[-max_days:]):
+                series = self._day_series(day, key)
+                if series is None:
+                    continue
+                points = series.points()
+                if carry is not None and points:
+                    # The change may straddle midnight
+                    if (points[-1].stock, points[-1].price) != (carry.stock, carry.price):
+                        changes.append((points[-1], carry))
+                for before, after in zip(reversed(points[:-1]), reversed(points[1:])):
+                    if len(changes) >= n:
+                        break
+                    if (before.stock, before.price) != (after.stock, after.price):
+                        changes.append((before, after))
+                if len(changes) >= n:
+                    break
+                if points:
+                    carry = points[0]
+        return changes[:n]
+
+    def summary(self) -> dict:
+        files = self._files()
+        return {"days": len({d for d, _ in files}),
+                "bytes": sum(os.path.getsize(os.path.join(self.directory, n)) for _, n in files)}
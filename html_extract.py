@@ -0,0 +1,55 @@
+from decoding import loads
+
+INITIAL_STATE_MARKER = b"__INITIAL_STATE__="
+SCRIPT_END = b"</script>"
+
+# ========= Streaming Initial-State Reader =========
+def stream_initial_state(resp, chunk_size: int = 16384, max_bytes: int = 8 * 1024 * 1024) -> str | None:
+    """Read a streamed page only until the embedded `__INITIAL_STATE__` script ends.
+
+    Bytes before the marker are discarded as they arrive (apart from a tail
+    long enough to catch a marker split across chunks), and the connection
+    is closed as soon as `</script>` is seen.
+    """
+    buf = bytearray()
+    found = False
+    read = 0
+    try:
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            read += len(chunk)
+            # Only the new bytes (plus a tag's worth of overlap) can hold the end tag
+            start = max(0, len(buf) - len(SCRIPT_END))
+            buf += chunk
+            if not found:
+                idx = buf.find(INITIAL_STATE_MARKER)
+                if idx < 0:
+                    del buf[:-(len(INITIAL_STATE_MARKER) - 1)]
+                    continue
+                del buf[:idx + len(INITIAL_STATE_MARKER)]
+                found = True
+                start = 0
+            end = buf.find(SCRIPT_END, start)
+            if end >= 0:
+                return buf[:end].decode("utf-8", errors="replace")
+            if read > max_bytes:
+                return None
+    finally:
+        resp.close()
+    return None
+
+def extract_item_fields(blob: str) -> dict | None:
+    """Pull the item name and its models out of an initial-state blob.
+
+    The blob already stops at `</script>`, so it goes through the C decoder
+    in one call; scanning around the other fields in Python was slower.
+    """
+    # The assignment usually ends with `;` before the closing tag
+    state = loads(blob.strip().rstrip(";"))
+    item = state.get("item") if isinstance(state, dict) else None
+    if not isinstance(item, dict) or not item.get("models"):
+        return None
+    models = item["models"]
+    if isinstance(models, dict):
+        # Some pages key models by id instead of listing them
+        models = list(models.values())
+    return {"item_name": item.get("name"), "model": models[0], "models": models}
@@ -0,0 +1,240 @@
+import re
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from logutil import log
+from metrics import BREAKER_TRANSITIONS, HTTP_RESPONSES, HTTP_SECONDS, status_class
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_ID_SEGMENT = re.compile(r"/\d+")
+
+# ========= Per-Host Rate Limiter =========
+class HostRateLimiter:
+    """Thread-safe spacing limiter: at most `rate` requests/second per host."""
+
+    def __init__(self, rates: dict[str, float] | None = None, default_rate: float | None = None):
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self._next_slot: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def rate_for(self, host: str) -> float | None:
+        return self.rates.get(host, self.default_rate)
+
+    def acquire(self, url: str):
+        host = urlsplit(url).hostname or ""
+        rate = self.rate_for(host)
+        if not rate or rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1.0 / rate
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+def parse_host_rates(spec: str) -> dict[str, float]:
+    """Parse "shopee.co.id=5,api.telegram.org=1" into {host: rate}."""
+    rates = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        host, _, value = part.partition("=")
+        try:
+            rates[host.strip()] = float(value)
+        except ValueError:
+            log("warning", "Invalid host rate ignored", entry=part)
+    return rates
+
+# ========= Circuit Breaker =========
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures.
+
+    While open every call fails fast; after `reset_timeout` seconds one probe
+    is let through (half-open). A successful probe closes the breaker, a
+    failed one re-opens it with the timeout doubled, up to `max_reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_reset_timeout: float = 600.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            log("warning" if state == "open" else "info", "Circuit breaker state change",
+                endpoint=self.name, previous=self.state, state=state, failures=self.failures)
+            BREAKER_TRANSITIONS.inc(self.name, state)
+            self.state = state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition("half_open")
+            # Half-open: a single probe at a time
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self.reset_timeout = self.base_reset_timeout
+            self._transition("closed")
+
+    def release(self):
+        """Free the half-open probe slot for a response that says nothing about the endpoint."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                self._probing = False
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+                self.opened_at = time.monotonic()
+                self._transition("open")
+            elif self.state == "closed" and self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition("open")
+
+    def retry_in(self) -> float:
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class CircuitBreakers:
+    """One breaker per endpoint (method, host and path with numeric ids folded)."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_reset_timeout: float = 600.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(method: str, url: str) -> str:
+        parts = urlsplit(url)
+        return f"{method} {parts.hostname}{_ID_SEGMENT.sub('/:id', parts.path or '/')}"
+
+    def for_request(self, method: str, url: str) -> CircuitBreaker:
+        name = self.endpoint(method, url)
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(
+                    name, self.failure_threshold, self.reset_timeout, self.max_reset_timeout))
+        return breaker
+
+    def summary(self) -> dict:
+        return {name: b.state for name, b in self._breakers.items() if b.state != "closed"}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After as delta-seconds or an HTTP date; None if absent or unparseable."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^(attempt-1)))."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+# ========= Safe HTTP Request with Retry =========
+def safe_request(session_or_module, url, params=None, headers=None,
+                 retries=3, delay=1.5, tag="", limiter=None, method="GET", json_body=None,
+                 breakers: CircuitBreakers | None = None, max_delay=30.0, max_retry_after=60.0,
+                 timeout=15, retry_statuses=RETRY_STATUSES):
+    """Request with retries on network errors, 429 and 5xx.
+
+    Backoff is exponential from `delay` with full jitter; a Retry-After
+    header is honoured when it fits under `max_retry_after`, otherwise the
+    throttled response is returned straight away. With `breakers`, an open
+    circuit for the endpoint fails fast and returns None without a request.
+    The last response is returned even when it is still a 429/5xx.
+    A caller that rotates clients can leave 429 out of `retry_statuses` to
+    get it back at once; it then counts neither for nor against the breaker.
+    """
+    breaker = breakers.for_request(method, url) if breakers is not None else None
+    resp = None
+    for attempt in range(1, retries + 1):
+        if breaker is not None and not breaker.allow():
+            HTTP_RESPONSES.inc(tag, "short_circuit")
+            log("warning", "Circuit open, request skipped", tag=tag, endpoint=breaker.name,
+                retry_in=round(breaker.retry_in(), 1))
+            return resp
+        wait = None
+        try:
+            if limiter is not None:
+                limiter.acquire(url)
+            started = time.perf_counter()
+            resp = session_or_module.request(method, url, params=params, headers=headers,
+                                             json=json_body, timeout=timeout)
+            HTTP_SECONDS.observe(time.perf_counter() - started, tag)
+            HTTP_RESPONSES.inc(tag, status_class(resp.status_code))
+            log("info", "HTTP request", tag=tag, attempt=attempt, status=resp.status_code, url=url)
+            if resp.status_code not in retry_statuses:
+                if breaker is not None:
+                    if resp.status_code in RETRY_STATUSES:
+                        breaker.release()
+                    else:
+                        breaker.record_success()
+                return resp
+            if breaker is not None:
+                breaker.record_failure()
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > max_retry_after:
+                    log("warning", "Retry-After too long, giving up", tag=tag, retry_after=retry_after)
+                    return resp
+                wait = retry_after
+        except Exception as e:
+            resp = None
+            HTTP_RESPONSES.inc(tag, "error")
+            if breaker is not None:
+                breaker.record_failure()
+            log("warning", "HTTP attempt failed", tag=tag, attempt=attempt, error=str(e))
+        if attempt < retries:
+            if wait is None:
+                wait = backoff_delay(attempt, delay, max_delay)
+            log("info", "HTTP retry scheduled", tag=tag, attempt=attempt, wait=round(wait, 2),
+                status=resp.status_code if resp is not None else None)
+            time.sleep(wait)
+    log("error", "HTTP all retries failed", tag=tag, url=url,
+        status=resp.status_code if resp is not None else None)
+    return resp
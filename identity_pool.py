@@ -0,0 +1,315 @@
+import json
+import time
+import random
+import threading
+
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+
+from logutil import log
+from http_client import RETRY_STATUSES, HostRateLimiter, parse_retry_after, safe_request
+from session_manager import SessionManager
+from metrics import IDENTITY_HEALTH, IDENTITY_REQUESTS
+
+# Statuses retried in place on the same identity; a 429 moves to another identity instead
+POOLED_RETRY_STATUSES = RETRY_STATUSES - {429}
+
+HEADER_PROFILES = {
+    "chrome-windows": {
+        "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                       "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"),
+        "Referer": "https://shopee.co.id/",
+        "Accept": "application/json",
+        "Accept-Language": "id-ID,id;q=0.9",
+    },
+    "firefox-linux": {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+        "Referer": "https://shopee.co.id/",
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "id,en-US;q=0.7,en;q=0.3",
+    },
+    "safari-mac": {
+        "User-Agent": ("Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) "
+                       "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15"),
+        "Referer": "https://shopee.co.id/",
+        "Accept": "application/json",
+        "Accept-Language": "id-ID,id;q=0.9,en;q=0.8",
+    },
+    "chrome-android": {
+        "User-Agent": ("Mozilla/5.0 (Linux; Android 14; SM-A546E) "
+                       "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36"),
+        "Referer": "https://shopee.co.id/",
+        "Accept": "application/json",
+        "Accept-Language": "id-ID,id;q=0.9",
+    },
+    "safari-iphone": {
+        "User-Agent": ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) "
+                       "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1"),
+        "Referer": "https://shopee.co.id/",
+        "Accept": "application/json",
+        "Accept-Language": "id-ID,id;q=0.9",
+    },
+}
+
+
+def identity_specs(proxies: str = "", profiles: str = "") -> list[dict]:
+    """Pair comma-separated proxies and header profile names round-robin.
+
+    "direct" in the proxy list means no proxy. With only proxies given every
+    built-in profile is cycled through; with only profiles, all go direct.
+    """
+    proxy_list = [p.strip() for p in (proxies or "").split(",") if p.strip()]
+    profile_list = [p.strip() for p in (profiles or "").split(",") if p.strip()]
+    if not proxy_list and not profile_list:
+        return []
+    proxy_list = proxy_list or ["direct"]
+    profile_list = profile_list or list(HEADER_PROFILES)
+    specs = []
+    for i in range(max(len(proxy_list), len(profile_list))):
+        proxy = proxy_list[i % len(proxy_list)]
+        specs.append({"name": f"id{i}", "proxy": None if proxy == "direct" else proxy,
+                      "profile": profile_list[i % len(profile_list)]})
+    return specs
+
+
+def load_identity_specs(path: str) -> list[dict]:
+    """Read a JSON list of {"name", "proxy", "profile" | "headers"} entries."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of identities")
+    return data
+
+# ========= Client Identity =========
+class Identity:
+    """One outgoing client: a proxy, a header profile, its own session and cookie jar.
+
+    `health` is an exponentially weighted success rate in [0, 1]. While
+    `cooldown_until` is in the future the pool does not hand it out.
+    """
+
+    def __init__(self, name: str, headers: dict, proxy: str | None = None,
+                 cookie_file: str | None = None, cookie_max_age: int = 1800,
+                 host_rates: dict[str, float] | None = None, pool_size: int = 8, breakers=None):
+        self.name = name
+        self.proxy = proxy
+        self.profile = dict(headers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Same connection pool and proxy, but never sends or keeps cookies (cookieless endpoints)
+        self.http = requests.Session()
+        self.http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        if proxy:
+            self.session.proxies = {"http": proxy, "https": proxy}
+            self.http.proxies = {"http": proxy, "https": proxy}
+        # Rate limits are per client, so each identity gets its own budget
+        self.limiter = HostRateLimiter(host_rates) if host_rates else None
+        self.sessions = SessionManager(self.headers, session=self.session, cookie_file=cookie_file,
+                                       max_age=cookie_max_age, limiter=self.limiter, breakers=breakers)
+        self.health = 1.0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.consecutive_errors = 0
+        self.in_flight = 0
+        self.requests = 0
+
+    def headers(self) -> dict:
+        return dict(self.profile)
+
+
+class IdentityPool:
+    """Spreads requests over identities, weighted by health, skipping ones cooling down.
+
+    A 429 benches the identity for its Retry-After, or `throttle_cooldown`
+    without one. A 403 drops its cookie jar; a second one in a row also
+    benches it for `forbidden_cooldown`, doubling on each further 403 up to
+    `max_cooldown`. `error_limit` network errors in a row (a dead proxy)
+    bench it for `throttle_cooldown`. 5xx only lower the health score,
+    since they say more about Shopee than about the client, and a request
+    an open circuit skipped is not scored at all. When every identity is
+    benched, a request waits up to `max_wait` for one to return.
+    """
+
+    def __init__(self, identities: list[Identity], alpha: float = 0.2, min_weight: float = 0.05,
+                 throttle_cooldown: float = 30.0, forbidden_cooldown: float = 30.0,
+                 max_cooldown: float = 3600.0, error_limit: int = 3, attempts: int = 2,
+                 max_wait: float = 5.0,
+                 rng: random.Random | None = None, clock=time.monotonic):
+        if not identities:
+            raise ValueError("IdentityPool needs at least one identity")
+        self.identities = list(identities)
+        self.alpha = alpha
+        self.min_weight = min_weight
+        self.throttle_cooldown = throttle_cooldown
+        self.forbidden_cooldown = forbidden_cooldown
+        self.max_cooldown = max_cooldown
+        self.error_limit = error_limit
+        self.attempts = max(1, attempts)
+        self.max_wait = max_wait
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_specs(cls, specs: list[dict], cookie_file: str | None = None, cookie_max_age: int = 1800,
+                   host_rates: dict[str, float] | None = None, pool_size: int = 8, breakers=None,
+                   **kwargs) -> "IdentityPool":
+        identities = []
+        for i, spec in enumerate(specs):
+            name = str(spec.get("name") or f"id{i}")
+            if "headers" in spec:
+                headers = spec["headers"]
+            else:
+                profile = spec.get("profile") or next(iter(HEADER_PROFILES))
+                if profile not in HEADER_PROFILES:
+                    raise ValueError(f"Unknown header profile {profile!r}, expected one of {tuple(HEADER_PROFILES)}")
+                headers = HEADER_PROFILES[profile]
+            jar = None
+            if cookie_file:
+                root, dot, ext = cookie_file.rpartition(".")
+                jar = f"{root}.{name}.{ext}" if dot else f"{cookie_file}.{name}"
+            identities.append(Identity(name, headers, proxy=spec.get("proxy"), cookie_file=jar,
+                                       cookie_max_age=cookie_max_age, host_rates=host_rates,
+                                       pool_size=pool_size, breakers=breakers))
+        log("info", "Identity pool ready", identities=len(identities),
+            proxied=sum(1 for i in identities if i.proxy))
+        return cls(identities, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.identities)
+
+    def acquire(self, exclude: tuple = ()) -> Identity | None:
+        """Pick a ready identity, or None when every one is cooling down."""
+        with self._lock:
+            now = self.clock()
+            ready = [i for i in self.identities if i.cooldown_until <= now and i not in exclude]
+            if not ready:
+                return None
+            # Healthier and less busy identities get proportionally more traffic
+            weights = [max(self.min_weight, i.health) / (1 + i.in_flight) for i in ready]
+            identity = self.rng.choices(ready, weights)[0]
+            identity.in_flight += 1
+            identity.requests += 1
+            return identity
+
+    def _bench(self, identity: Identity, seconds: float, reason: str):
+        identity.cooldown_until = self.clock() + seconds
+        log("warning", "Identity cooling down", identity=identity.name, reason=reason,
+            seconds=round(seconds, 1), health=round(identity.health, 2))
+
+    def report(self, identity: Identity, resp) -> str:
+        """Release `identity` and score the response it got; returns the outcome."""
+        status = resp.status_code if resp is not None else None
+        success = status is not None and status < 500 and status not in (403, 429)
+        with self._lock:
+            identity.in_flight = max(0, identity.in_flight - 1)
+            identity.health += self.alpha * (float(success) - identity.health)
+            if status is None:
+                outcome = "error"
+                identity.consecutive_errors += 1
+                if identity.consecutive_errors >= self.error_limit:
+                    identity.consecutive_errors = 0
+                    self._bench(identity, self.throttle_cooldown, "errors")
+            elif status == 429:
+                outcome = "throttled"
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                self._bench(identity, min(self.max_cooldown, retry_after if retry_after is not None
+                                          else self.throttle_cooldown), "429")
+            elif status == 403:
+                outcome = "forbidden"
+                identity.strikes += 1
+                identity.sessions.invalidate(reason="403")
+                # A single 403 is usually just a stale jar; repeated ones mean this client is blocked
+                if identity.strikes > 1:
+                    self._bench(identity, min(self.max_cooldown,
+                                              self.forbidden_cooldown * 2 ** (identity.strikes - 2)), "403")
+            elif status >= 500:
+                outcome = "server_error"
+            else:
+                outcome = "ok"
+                identity.strikes = 0
+                identity.consecutive_errors = 0
+        IDENTITY_REQUESTS.inc(identity.name, outcome)
+        IDENTITY_HEALTH.set(identity.health, identity.name)
+        return outcome
+
+    def release(self, identity: Identity):
+        """Hand `identity` back without scoring it (no request was sent)."""
+        with self._lock:
+            identity.in_flight = max(0, identity.in_flight - 1)
+        IDENTITY_REQUESTS.inc(identity.name, "skipped")
+
+    @staticmethod
+    def _short_circuited(breakers, method: str, url: str, started: float) -> bool:
+        # Open since before the call and never probed by it: safe_request returned without sending
+        if breakers is None:
+            return False
+        breaker = breakers.for_request(method, url)
+        return breaker.state == "open" and breaker.opened_at < started
+
+    def request(self, url: str, params=None, headers=None, tag: str = "", method: str = "GET",
+                json_body=None, breakers=None, cookies: bool = True):
+        """Send through a pooled identity, moving to another one after a 403/429.
+
+        `headers` are layered over the identity's profile (e.g. conditional
+        request headers). With `cookies` the identity's jar is bootstrapped
+        first; without, it goes out through the identity's cookieless session.
+        Returns the last response, or None if no identity was ready.
+        """
+        tried = []
+        resp = None
+        for _ in range(min(self.attempts, len(self.identities))):
+            identity = self.acquire(exclude=tuple(tried))
+            if identity is None and not tried:
+                wait = self.retry_in()
+                if wait <= self.max_wait:
+                    time.sleep(wait)
+                    identity = self.acquire()
+                if identity is None:
+                    log("warning", "No identity available", tag=tag, retry_in=round(self.retry_in(), 1))
+            if identity is None:
+                break
+            tried.append(identity)
+            started = time.monotonic()
+            try:
+                if cookies:
+                    identity.sessions.ensure()
+                resp = safe_request(identity.session if cookies else identity.http, url, params=params,
+                                    headers={**identity.headers(), **(headers or {})}, tag=tag,
+                                    limiter=identity.limiter, method=method, json_body=json_body,
+                                    breakers=breakers, retry_statuses=POOLED_RETRY_STATUSES)
+            except Exception:
+                self.report(identity, None)
+                raise
+            if resp is None and self._short_circuited(breakers, method, url, started):
+                # The endpoint is down for every identity; nothing to learn about this one
+                self.release(identity)
+                break
+            if self.report(identity, resp) not in ("throttled", "forbidden"):
+                break
+        return resp
+
+    def retry_in(self) -> float:
+        """Seconds until the next identity comes off cooldown (0 if one is ready)."""
+        with self._lock:
+            now = self.clock()
+            return max(0.0, min(i.cooldown_until for i in self.identities) - now)
+
+    def summary(self) -> dict:
+        with self._lock:
+            now = self.clock()
+            return {
+                i.name: {"health": round(i.health, 2), "requests": i.requests,
+                         "cooldown": round(max(0.0, i.cooldown_until - now), 1)}
+                for i in self.identities
+            }
+
+    def ready_count(self) -> int:
+        with self._lock:
+            now = self.clock()
+            return sum(1 for i in self.identities if i.cooldown_until <= now)
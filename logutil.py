@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import atexit
+import itertools
+import threading
+from queue import SimpleQueue, Empty
+from datetime import datetime, timedelta
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "critical": 50}
+
+# Per-product chatter that repeats for every item on every pass
+SAMPLED_MESSAGES = (
+    "HTTP request",
+    "Checking product (method1)",
+    "Checking product (method2)",
+    "Processing product",
+    "Fetched product status",
+    "No change",
+)
+
+_threshold = LEVELS["info"]
+_sample_every = 1
+_sampled: dict[str, int] = dict.fromkeys(SAMPLED_MESSAGES, 0)
+_async = True
+_max_pending = 10000
+
+
+# ========= Background Log Writer =========
+class _LogWriter:
+    """Formats and writes queued records on one daemon thread, a batch per write."""
+
+    def __init__(self):
+        self._queue = SimpleQueue()
+        self._queued = itertools.count(1)
+        self._last_queued = 0
+        self._written = 0
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self._pid = os.getpid()
+        self._second = None
+        self._stamps = ("", "")
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: tuple):
+        if record[1] < LEVELS["warning"] and self._queue.qsize() >= _max_pending:
+            # Shed routine lines rather than grow without bound when stdout stalls
+            self.dropped += 1
+            return
+        self._last_queued = next(self._queued)
+        self._queue.put(record)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        target = self._last_queued
+        with self._cond:
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < 512:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(self._format(record))
+                except Exception as e:
+                    lines.append(json.dumps({"level": "ERROR", "message": "Log record dropped",
+                                             "extra": {"original": record[2], "error": str(e)}}))
+            if self.dropped:
+                lines.append(self._format((time.time(), LEVELS["warning"], "Log records dropped",
+                                           {"count": self.dropped}, 1)))
+                self.dropped = 0
+            _write("\n".join(lines) + "\n")
+            with self._cond:
+                self._written += len(batch)
+                self._cond.notify_all()
+
+    def _format(self, record: tuple) -> str:
+        ts, level, message, extra, sample_every = record
+        second = int(ts)
+        if second != self._second:
+            # Timestamps have one-second resolution, so format them once per second
+            utc = datetime.utcfromtimestamp(second)
+            wib = utc + timedelta(hours=7)
+            self._stamps = (utc.isoformat(timespec="seconds") + "Z", wib.strftime("%Y-%m-%d %H:%M:%S"))
+            self._second = second
+        return _render(self._stamps, level, message, extra, sample_every)
+
+
+def _render(stamps: tuple, level: int, message: str, extra: dict, sample_every: int) -> str:
+    for key, value in extra.items():
+        if callable(value):
+            extra[key] = value()
+    if sample_every > 1:
+        extra["sample_every"] = sample_every
+    entry = {
+        "ts_utc": stamps[0],
+        "ts_wib": stamps[1],
+        "level": _LEVEL_NAMES[level],
+        "message": message,
+        "extra": extra
+    }
+    return json.dumps(entry, default=str)
+
+
+_LEVEL_NAMES = {v: k.upper() for k, v in LEVELS.items()}
+_writer: _LogWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def _write(text: str):
+    try:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    except (ValueError, OSError):
+        # stdout closed or redirected away during shutdown
+        pass
+
+
+def _get_writer() -> _LogWriter:
+    global _writer
+    writer = _writer
+    if writer is None or writer._pid != os.getpid():
+        # Threads don't survive fork, so each worker process starts its own writer
+        with _writer_lock:
+            if _writer is None or _writer._pid != os.getpid():
+                _writer = _LogWriter()
+            writer = _writer
+    return writer
+
+
+def configure_logging(level: str = "info", sample_every: int = 1, async_writer: bool = True,
+                      max_pending: int = 10000):
+    """Set the level threshold, 1-in-N sampling for SAMPLED_MESSAGES and the writer mode."""
+    global _threshold, _sample_every, _async, _max_pending
+    if level.lower() not in LEVELS:
+        raise ValueError(f"Unknown log level {level!r}, expected one of {tuple(LEVELS)}")
+    flush()
+    _threshold = LEVELS[level.lower()]
+    _sample_every = max(1, int(sample_every))
+    _sampled.clear()
+    for message in SAMPLED_MESSAGES:
+        _sampled[message] = 0
+    _async = async_writer
+    _max_pending = max_pending
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Wait until every queued record has been written."""
+    writer = _writer
+    if writer is None or writer._pid != os.getpid():
+        return True
+    return writer.flush(timeout)
+
+
+atexit.register(flush)
+
+
+# ========= Structured Logging Helper =========
+def log(level: str, message: str, **extra):
+    """Queue a JSON log line; values in `extra` may be callables, evaluated only if the line is written."""
+    lvl = LEVELS.get(level, LEVELS["info"])
+    if lvl < _threshold:
+        return
+    if _sample_every > 1 and lvl < LEVELS["warning"] and message in _sampled:
+        seen = _sampled[message]
+        _sampled[message] = seen + 1
+        if seen % _sample_every:
+            return
+        sample_every = _sample_every
+    else:
+        sample_every = 1
+    if not message or message.strip() == "":
+        message = "<EMPTY_MESSAGE>"
+    record = (time.time(), lvl, message, extra, sample_every)
+    if _async:
+        _get_writer().put(record)
+    else:
+        utc = datetime.utcfromtimestamp(int(record[0]))
+        stamps = (utc.isoformat(timespec="seconds") + "Z",
+                  (utc + timedelta(hours=7)).strftime("%Y-%m-%d %H:%M:%S"))
+        _write(_render(stamps, lvl, message, extra, sample_every) + "\n")
@@ -1,91 +1,153 @@
 import os
-import json
 import time
+import signal
+import threading
 import traceback
 import requests
 from datetime import datetime, timedelta
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
 
-# ========= Structured Logging Helper =========
-def log(level: str, message: str, **extra):
-    if not message or message.strip() == "":
-        message = "<EMPTY_MESSAGE>"
-    utc = datetime.utcnow()
-    wib = utc + timedelta(hours=7)
-    entry = {
-        "ts_utc": utc.isoformat(timespec="seconds") + "Z",
-        "ts_wib": wib.strftime("%Y-%m-%d %H:%M:%S"),
-        "level": level.upper(),
-        "message": message,
-        "extra": extra
-    }
-    print(json.dumps(entry), flush=True)
-
-# ========= Safe HTTP Request with Retry =========
-def safe_request(session_or_module, url, params=None, headers=None,
-                 retries=3, delay=1.5, tag=""):
-    for attempt in range(1, retries + 1):
-        try:
-            resp = session_or_module.get(url, params=params, headers=headers, timeout=15)
-            log("info", "HTTP request", tag=tag, attempt=attempt, status=resp.status_code, url=url)
-            return resp
-        except Exception as e:
-            log("warning", "HTTP attempt failed", tag=tag, attempt=attempt, error=str(e))
-            time.sleep(delay)
-    log("error", "HTTP all retries failed", tag=tag, url=url)
-    return None
+from logutil import log, configure_logging
+from http_client import CircuitBreakers, HostRateLimiter, parse_host_rates, safe_request
+from polling import SKIPPED, AsyncPoller
+from batching import BatchFetcher, product_key
+from session_manager import SessionManager
+from method_router import MethodRouter
+from state_store import open_state_store, state_record
+from scheduler import PollScheduler
+from notifier import TelegramDispatcher
+from response_cache import ResponseCache
+from sharding import ShardWorker, SqliteCoordinator, worker_path
+from variants import VariantIndex
+from decoding import decode_response, project_item
+from history import HistoryStore
+from identity_pool import IdentityPool, identity_specs, load_identity_specs
+from rules import RuleEngine, format_rule_hit
+from watchlist import WatchlistStore, subscribers
+from coalescing import ResultCoalescer
+from checkpoint import decode_cached, encode_cached, load_checkpoint, save_checkpoint
+from commands import TelegramCommands
+from metrics import CHECKS, PASS_SECONDS, QUEUE_DEPTH, PassProfiler, start_metrics_server
+
+MONITOR_MODES = ("serial", "async")
+SCHEDULES = ("fixed", "adaptive")
 
 class ShopeeMonitor:
-    def __init__(self, telegram_bot_token: str, telegram_chat_id: str, state_file: str = "product_state.json"):
+    def __init__(self, telegram_bot_token: str, telegram_chat_id: str, state_file: str = "product_state.json",
+                 mode: str = "serial", concurrency: int = 8,
+                 host_rates: dict[str, float] | None = None, batch_size: int = 0,
+                 cookie_file: str | None = None, cookie_max_age: int = 1800,
+                 state_backend: str = "json", schedule: str = "fixed", rpm_budget: float | None = None,
+                 min_interval: int = 30, max_interval: int = 3600,
+                 outbox_file: str | None = None, digest_threshold: int = 5,
+                 variant_file: str | None = None, watchlist_file: str | None = None,
+                 watchlist_poll: float = 5.0, profile_dir: str | None = None,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 history_dir: str | None = None, history_retention_days: int = 90,
+                 history_max_bytes: int = 200 * 1024 * 1024, identities: list[dict] | None = None,
+                 result_ttl: float = 15.0, checkpoint_file: str | None = None,
+                 checkpoint_max_age: float = 86400, checkpoint_every: float = 30.0,
+                 drain_timeout: float = 20.0):
+        if mode not in MONITOR_MODES:
+            raise ValueError(f"Unknown monitor mode {mode!r}, expected one of {MONITOR_MODES}")
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule {schedule!r}, expected one of {SCHEDULES}")
         self.telegram_bot_token = telegram_bot_token
         self.telegram_chat_id = telegram_chat_id
         self.telegram_api = f"https://api.telegram.org/bot{telegram_bot_token}"
+        self.notifier = TelegramDispatcher(self.telegram_api, telegram_chat_id, outbox_file=outbox_file,
+                                           digest_threshold=digest_threshold)
         self.state_file = state_file
+        self.store = open_state_store(state_file, state_backend)
+        self.mode = mode
+        self.concurrency = max(1, int(concurrency))
+        self.schedule = schedule
+        self.rpm_budget = rpm_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.scheduler: PollScheduler | None = None
+        # Optional callable(dedup_key) -> bool deciding whether this process sends an alert
+        self.alert_gate = None
+        # Set by SIGTERM / request_stop(): finish in-flight work, start nothing new
+        self._stop = threading.Event()
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_max_age = checkpoint_max_age
+        self.checkpoint_every = checkpoint_every
+        self.drain_timeout = drain_timeout
+        self._checkpointed_at = 0.0
+        self._next_pass_at: float | None = None
+        # Fixed schedule: products a stop cut out of the last pass, checked first on resume
+        self._unfinished: list[str] = []
+        self.commands = None
         self.session = requests.Session()
-        log("info", "ShopeeMonitor initialized", state_file=state_file)
+        # One pool shared by every worker thread in async mode
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Cookieless client for method2, pooled like `session` but never sent the bootstrapped jar
+        self.http = requests.Session()
+        self.http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        http_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+        self.http.mount("https://", http_adapter)
+        self.http.mount("http://", http_adapter)
+        self.rate_limiter = HostRateLimiter(host_rates) if host_rates else None
+        self.breakers = CircuitBreakers(failure_threshold=breaker_threshold, reset_timeout=breaker_reset)
+        self.sessions = SessionManager(self._headers, session=self.session, cookie_file=cookie_file,
+                                       max_age=cookie_max_age, limiter=self.rate_limiter,
+                                       breakers=self.breakers)
+        # With an identity pool every Shopee request goes through one of its sessions
+        self.identities = (IdentityPool.from_specs(identities, cookie_file=cookie_file,
+                                                   cookie_max_age=cookie_max_age, host_rates=host_rates,
+                                                   pool_size=self.concurrency, breakers=self.breakers)
+                           if identities else None)
+        self.response_cache = ResponseCache()
+        self.variant_file = variant_file
+        self.variants = VariantIndex()
+        self.rules = RuleEngine()
+        self.history = (HistoryStore(history_dir, retention_days=history_retention_days,
+                                     max_bytes=history_max_bytes) if history_dir else None)
+        self.watchlist = WatchlistStore(watchlist_file) if watchlist_file else None
+        self.watchlist_poll = watchlist_poll
+        self.products: list[dict] = []
+        # Latest fetched info per product key, read by the bot command handler
+        self.snapshots: dict[str, dict] = {}
+        # Stored `updated_at` each product had before its latest check; ties dedup keys to one observation
+        self._prior_update: dict[str, float | None] = {}
+        self.profiler = PassProfiler(profile_dir)
+        QUEUE_DEPTH.set_function(self.notifier.pending, "telegram")
+        QUEUE_DEPTH.set_function(lambda: self.scheduler.due_count() if self.scheduler else 0, "scheduler_due")
+        QUEUE_DEPTH.set_function(lambda: len(self.scheduler) if self.scheduler else len(self.products),
+                                 "products")
+        if variant_file:
+            self.variants.load(variant_file)
+        self.fetch_methods = {"method1": self.fetch_method1, "method2": self.fetch_method2}
+        self.router = MethodRouter(list(self.fetch_methods))
+        # Every fetch path goes through here, so overlapping requests for a product share one fetch
+        self.results = ResultCoalescer(self.check_product, ttl=result_ttl)
+        self.poller = AsyncPoller(self.results.get, concurrency=self.concurrency,
+                                  should_stop=self._stop.is_set)
+        self.batcher = (BatchFetcher(self.session, self._headers, limiter=self.rate_limiter,
+                                     batch_size=batch_size, cache=self.response_cache,
+                                     breakers=self.breakers, identities=self.identities)
+                        if batch_size > 0 else None)
+        log("info", "ShopeeMonitor initialized", state_file=state_file, state_backend=state_backend,
+            mode=mode, concurrency=self.concurrency, host_rates=host_rates or {},
+            batch_size=batch_size, identities=len(self.identities) if self.identities else 0)
 
     def get_wib_time(self) -> str:
         utc_time = datetime.utcnow()
         return (utc_time + timedelta(hours=7)).strftime("%Y-%m-%d %H:%M:%S")
 
-    def load_state(self) -> dict:
-        try:
-            if os.path.exists(self.state_file):
-                with open(self.state_file, "r") as f:
-                    data = json.load(f)
-                    log("info", "State loaded", entries=len(data))
-                    return data
-        except Exception as e:
-            log("warning", "Failed loading state", error=str(e))
-        return {}
-
-    def save_state(self, state: dict):
-        try:
-            with open(self.state_file, "w") as f:
-                json.dump(state, f, indent=2)
-            log("info", "State saved", entries=len(state))
-        except Exception as e:
-            log("error", "Failed saving state", error=str(e))
-
     def send_telegram(self, message: str) -> bool:
-        if not message or message.strip() == "":
-            message = "<EMPTY_MESSAGE>"
-        try:
-            url = f"{self.telegram_api}/sendMessage"
-            payload = {
-                "chat_id": self.telegram_chat_id,
-                "text": message,
-                "parse_mode": "HTML",
-                "disable_web_page_preview": False
-            }
-            resp = requests.post(url, json=payload, timeout=30)
-            if resp.status_code == 200:
-                log("info", "Telegram sent", length=len(message))
-                return True
-            else:
-                log("error", "Telegram failed", status_code=resp.status_code, body=resp.text[:250])
-        except Exception as e:
-            log("error", "Telegram exception", error=str(e))
-        return False
+        # Delivery, retries and digests are handled by the background dispatcher
+        self.notifier.enqueue(message)
+        return True
+
+    def notify_subscribers(self, product: dict, message: str):
+        """Fan a product alert out to every chat subscribed to it."""
+        for chat_id in subscribers(product, self.telegram_chat_id):
+            self.notifier.enqueue(message, chat_id=chat_id)
 
     def _headers(self):
         return {
@@ -98,151 +160,475 @@ class ShopeeMonitor:
             "Accept-Language": "id-ID,id;q=0.9",
         }
 
-    def check_product(self, shop_id: str, item_id: str) -> dict | None:
-        headers = self._headers()
+    def _cached_result(self, cache_key: str, resp, source: str) -> dict | None:
+        # Same body (or a 304) as last time: reuse the parsed record untouched
+        cached = self.response_cache.lookup(cache_key, resp)
+        return {**cached.info(source), "unchanged": True} if cached is not None else None
 
-        # Method 1
+    def fetch_method1(self, shop_id: str, item_id: str) -> dict | None:
+        cache_key = f"method1:{shop_id}_{item_id}"
+        conditional = self.response_cache.conditional_headers(cache_key)
         log("info", "Checking product (method1)", shop_id=shop_id, item_id=item_id)
-        # Bootstrap cookies
-        safe_request(self.session, "https://shopee.co.id/", headers=headers, tag="cookie-bootstrap")
-        time.sleep(0.3)
-        resp1 = safe_request(self.session, "https://shopee.co.id/api/v4/item/get",
-                             params={"shopid": shop_id, "itemid": item_id},
-                             headers=headers, tag="method1")
+        if self.identities is not None:
+            # Each identity bootstraps its own cookies; a 403/429 moves to the next one
+            resp1 = self.identities.request("https://shopee.co.id/api/v4/item/get",
+                                            params={"shopid": shop_id, "itemid": item_id},
+                                            headers=conditional, tag="method1", breakers=self.breakers)
+        else:
+            headers = {**self._headers(), **conditional}
+            # Cookies are bootstrapped once and reused until expiry or a 403
+            self.sessions.ensure()
+            resp1 = safe_request(self.session, "https://shopee.co.id/api/v4/item/get",
+                                 params={"shopid": shop_id, "itemid": item_id},
+                                 headers=headers, tag="method1", limiter=self.rate_limiter,
+                                 breakers=self.breakers)
+            if self.sessions.note_response(resp1):
+                self.sessions.ensure()
+                resp1 = safe_request(self.session, "https://shopee.co.id/api/v4/item/get",
+                                     params={"shopid": shop_id, "itemid": item_id},
+                                     headers=headers, tag="method1", limiter=self.rate_limiter,
+                                     breakers=self.breakers)
+
+        cached = self._cached_result(cache_key, resp1, "method1")
+        if cached is not None:
+            return cached
 
         if resp1 and resp1.status_code == 200:
             try:
-                data = resp1.json()
-                if data.get("data"):
-                    item = data["data"]
-                    raw_price = item.get("price", 0)
-                    price_rp = (raw_price / 100000) if isinstance(raw_price, (int, float)) else 0
-                    stock = item.get("stock", 0) or 0
-                    result = {
-                        "name": item.get("name", "Unknown"),
-                        "stock": stock,
-                        "price": price_rp,
-                        "available": stock > 0,
-                        "source": "method1"
-                    }
-                    log("info", "Method1 success", name=result["name"], stock=stock, price=price_rp)
-                    return result
+                data = decode_response(resp1)
+                record = project_item(data, "data")
+                if record is not None:
+                    log("info", "Method1 success", name=record.name, stock=record.stock, price=record.price)
+                    self.response_cache.store(cache_key, resp1, record)
+                    return record.info("method1")
                 else:
                     log("warning", "Method1 no usable data", keys=list(data.keys()))
             except Exception as e:
                 log("warning", "Method1 parse error", error=str(e))
+        return None
 
-        # Method 2
+    def fetch_method2(self, shop_id: str, item_id: str) -> dict | None:
+        cache_key = f"method2:{shop_id}_{item_id}"
+        conditional = self.response_cache.conditional_headers(cache_key)
         log("info", "Checking product (method2)", shop_id=shop_id, item_id=item_id)
-        resp2 = safe_request(requests, "https://shopee.co.id/api/v4/pdp/get_pc",
-                             params={"shop_id": shop_id, "item_id": item_id},
-                             headers=headers, tag="method2")
+        if self.identities is not None:
+            resp2 = self.identities.request("https://shopee.co.id/api/v4/pdp/get_pc",
+                                            params={"shop_id": shop_id, "item_id": item_id},
+                                            headers=conditional, tag="method2", breakers=self.breakers,
+                                            cookies=False)
+        else:
+            resp2 = safe_request(self.http, "https://shopee.co.id/api/v4/pdp/get_pc",
+                                 params={"shop_id": shop_id, "item_id": item_id},
+                                 headers={**self._headers(), **conditional}, tag="method2",
+                                 limiter=self.rate_limiter, breakers=self.breakers)
+
+        cached = self._cached_result(cache_key, resp2, "method2")
+        if cached is not None:
+            return cached
 
         if resp2 and resp2.status_code == 200:
             try:
-                data2 = resp2.json()
-                if data2.get("item"):
-                    item2 = data2["item"]
-                    raw_price = item2.get("price", 0)
-                    price_rp = (raw_price / 100000) if isinstance(raw_price, (int, float)) else 0
-                    stock = item2.get("stock", 0) or 0
-                    result = {
-                        "name": item2.get("name", "Unknown"),
-                        "stock": stock,
-                        "price": price_rp,
-                        "available": stock > 0,
-                        "source": "method2"
-                    }
-                    log("info", "Method2 success", name=result["name"], stock=stock, price=price_rp)
-                    return result
+                data2 = decode_response(resp2)
+                record = project_item(data2, "item")
+                if record is not None:
+                    log("info", "Method2 success", name=record.name, stock=record.stock, price=record.price)
+                    self.response_cache.store(cache_key, resp2, record)
+                    return record.info("method2")
                 else:
                     log("warning", "Method2 no item field", keys=list(data2.keys()))
             except Exception as e:
                 log("warning", "Method2 parse error", error=str(e))
-
-        log("error", "All methods failed", shop_id=shop_id, item_id=item_id)
         return None
 
-    def monitor_once(self, products: list[dict]):
-        wib_time = self.get_wib_time()
-        log("info", "Monitor pass started", wib_time=wib_time, products=len(products))
-        state = self.load_state()
-        new_state = {}
-
-        for idx, product in enumerate(products, start=1):
-            shop_id = product["shop_id"]
-            item_id = product["item_id"]
-            key = f"{shop_id}_{item_id}"
-            log("info", "Processing product", index=idx, total=len(products), key=key)
-
-            info = self.check_product(shop_id, item_id)
-            if info:
-                current = info["available"]
-                prev = state.get(key)
-                log("info", "Fetched product status",
-                    key=key, name=info["name"], stock=info["stock"],
-                    price=info["price"], available=current, source=info["source"])
-
-                if prev is not None and prev != current:
-                    emoji = "✅" if current else "❌"
-                    status_word = "READY" if current else "HABIS"
-                    log("info", "Status changed", key=key, previous=prev, current=current)
-
-                    msg = (
-                        f"{emoji} <b>PRODUK {status_word}!</b>\n\n"
-                        f"📦 <b>{info['name']}</b>\n"
-                        f"💰 Rp {info['price']:,.0f}\n"
-                        f"📊 Stok: {info['stock']} unit\n"
-                        f"🕐 {wib_time} WIB\n\n"
-                        f"🔗 <a href='https://shopee.co.id/product/{shop_id}/{item_id}'>"
-                        f"{'BELI SEKARANG!' if current else 'Lihat Produk'}</a>"
-                    )
-                    self.send_telegram(msg)
-                elif prev is None:
-                    log("info", "Baseline stored", key=key, status=current)
-                else:
-                    log("info", "No change", key=key, status=current)
+    def check_product(self, shop_id: str, item_id: str) -> dict | None:
+        # Best-performing method first; demoted ones are probed periodically
+        result = self.router.run(self.fetch_methods, shop_id, item_id)
+        if result is None:
+            log("error", "All methods failed", shop_id=shop_id, item_id=item_id)
+        return result
+
+    def record_snapshot(self, key: str, info: dict):
+        self.snapshots[key] = {**info, "checked_at": time.time()}
 
-                new_state[key] = current
+    def process_result(self, product: dict, info: dict | None, wib_time: str) -> str:
+        shop_id = product["shop_id"]
+        item_id = product["item_id"]
+        key = product_key(product)
+        if info:
+            self.record_snapshot(key, info)
+            current = info["available"]
+            record = self.store.get(key)
+            prev = record["available"] if record else None
+            self._prior_update[key] = record.get("updated_at") if record else None
+            if info.get("unchanged") and prev == current:
+                # Only trusted while the stored state agrees with the cached payload
+                log("info", "No change", key=key, status=current, cached=True)
+                return "unchanged"
+            log("info", "Fetched product status",
+                key=key, name=info["name"], stock=info["stock"],
+                price=info["price"], available=current, source=info["source"])
+
+            if prev is not None and prev != current:
+                emoji = "✅" if current else "❌"
+                status_word = "READY" if current else "HABIS"
+                log("info", "Status changed", key=key, previous=prev, current=current)
+
+                msg = (
+                    f"{emoji} <b>PRODUK {status_word}!</b>\n\n"
+                    f"📦 <b>{info['name']}</b>\n"
+                    f"💰 Rp {info['price']:,.0f}\n"
+                    f"📊 Stok: {info['stock']} unit\n"
+                    f"🕐 {wib_time} WIB\n\n"
+                    f"🔗 <a href='https://shopee.co.id/product/{shop_id}/{item_id}'>"
+                    f"{'BELI SEKARANG!' if current else 'Lihat Produk'}</a>"
+                )
+                dedup_key = f"{key}:{int(prev)}->{int(current)}:{record.get('updated_at')}"
+                if self.rules.covers_flip(product, current):
+                    # A back_in_stock rule sends its own alert for this restock
+                    log("info", "Alert left to rules", key=key)
+                elif self.claim_alert(dedup_key):
+                    self.notify_subscribers(product, msg)
+                outcome = "changed"
+            elif prev is None:
+                log("info", "Baseline stored", key=key, status=current)
+                outcome = "baseline"
             else:
-                log("warning", "Product fetch failed", key=key)
-                if key in state:
-                    new_state[key] = state[key]
+                log("info", "No change", key=key, status=current)
+                outcome = "unchanged"
 
-        self.save_state(new_state)
-        changed = sum(1 for k, v in new_state.items() if state.get(k) != v)
-        failures = sum(1 for p in products if f"{p['shop_id']}_{p['item_id']}" not in new_state)
+            self.store.upsert(key, state_record(info))
+            return outcome
+
+        # Failed fetches keep whatever baseline the store already has
+        log("warning", "Product fetch failed", key=key)
+        return "failed"
+
+    def claim_alert(self, dedup_key: str) -> bool:
+        """False if another worker already claimed the alert for `dedup_key`."""
+        if self.alert_gate is None or self.alert_gate(dedup_key):
+            return True
+        log("info", "Duplicate alert suppressed", dedup_key=dedup_key)
+        return False
+
+    def check_batch(self, products: list[dict], wib_time: str) -> list[tuple[dict, dict | None, str]]:
+        results = []
+
+        # Bulk lookups first; only misses go through the per-item methods
+        if self.batcher and self.identities is None:
+            self.sessions.ensure()
+        prefetched = self.batcher.fetch_many(products) if self.batcher else {}
+        for key, info in prefetched.items():
+            self.results.prime(key, info)
+
+        with self.notifier.collect():
+            if self.mode == "async":
+                misses = [p for p in products if product_key(p) not in prefetched]
+                fetched = {product_key(p): info for p, info in self.poller.run(misses)}
+                with self.store.transaction():
+                    for product in products:
+                        key = product_key(product)
+                        info = prefetched[key] if key in prefetched else fetched.get(key)
+                        if info is SKIPPED:
+                            continue
+                        results.append((product, info, self.process_result(product, info, wib_time)))
+            else:
+                with self.store.transaction():
+                    for idx, product in enumerate(products, start=1):
+                        key = product_key(product)
+                        info = prefetched.get(key)
+                        if info is None:
+                            if self._stop.is_set():
+                                # Shutting down: leave the rest for the next run
+                                continue
+                            log("info", "Processing product", index=idx, total=len(products), key=key)
+                            info = self.results.get(product["shop_id"], product["item_id"])
+                        results.append((product, info, self.process_result(product, info, wib_time)))
+            self.process_variants(results, wib_time)
+            for hit in self.rules.evaluate(results):
+                key = product_key(hit.product)
+                log("info", "Rule triggered", key=key, rule=hit.rule,
+                    threshold=hit.threshold, price=hit.info["price"], stock=hit.info["stock"])
+                if self.claim_alert(f"{key}:{hit.rule}:{hit.threshold:g}:{self._prior_update.get(key)}"):
+                    self.notify_subscribers(hit.product, format_rule_hit(hit, wib_time))
+        if len(results) < len(products):
+            done = {product_key(p) for p, _, _ in results}
+            self._unfinished = [product_key(p) for p in products if product_key(p) not in done]
+            log("info", "Batch cut short by shutdown", processed=len(results), skipped=len(self._unfinished))
+        for _, _, outcome in results:
+            CHECKS.inc(outcome)
+        if self.history is not None:
+            self.history.record_many((product_key(p), info["stock"], info["price"])
+                                     for p, info, _ in results if info)
+            self.history.flush()
+        return results
+
+    def process_variants(self, results: list[tuple[dict, dict | None, str]], wib_time: str):
+        # One bulk diff per batch; cached payloads the state store agreed with can't have moved
+        updates = []
+        names = {}
+        for product, info, outcome in results:
+            if not info or (info.get("unchanged") and outcome == "unchanged") or not info.get("models"):
+                continue
+            key = product_key(product)
+            for model_id, model_name, stock, price in info["models"]:
+                updates.append((key, model_id, stock, price))
+                names[(key, model_id)] = model_name
+        if not updates:
+            return
+        changes = self.variants.apply(updates)
+        infos = {product_key(p): (p, info, outcome) for p, info, outcome in results}
+
+        for change in changes:
+            product, info, outcome = infos[change.item_key]
+            variant_name = names.get((change.item_key, change.model_id)) or str(change.model_id)
+            log("info", "Variant changed", key=change.item_key, model_id=change.model_id,
+                variant=variant_name, previous=change.old_stock, current=change.new_stock)
+            # A product-level flip already alerted for this item
+            if outcome == "changed":
+                continue
+            dedup_key = (f"{change.item_key}:{change.model_id}:{change.old_stock}->{change.new_stock}:"
+                         f"{self._prior_update.get(change.item_key)}")
+            if not self.claim_alert(dedup_key):
+                continue
+            restock = change.kind == "restock"
+            self.notify_subscribers(
+                product,
+                f"{'✅' if restock else '❌'} <b>VARIAN {'READY' if restock else 'HABIS'}!</b>\n\n"
+                f"📦 <b>{info['name']}</b>\n"
+                f"🎨 Varian: {variant_name}\n"
+                f"💰 Rp {change.new_price:,.0f}\n"
+                f"📊 Stok: {change.new_stock} unit\n"
+                f"🕐 {wib_time} WIB\n\n"
+                f"🔗 <a href='https://shopee.co.id/product/{product['shop_id']}/{product['item_id']}'>"
+                f"{'BELI SEKARANG!' if restock else 'Lihat Produk'}</a>"
+            )
+        if self.variant_file and self.variants.dirty:
+            self.variants.save(self.variant_file)
+
+    def monitor_once(self, products: list[dict]):
+        wib_time = self.get_wib_time()
+        log("info", "Monitor pass started", wib_time=wib_time, products=len(products), mode=self.mode)
+        # Rules always cover the whole watchlist, so a shard's subset doesn't drop the others' memory
+        self.rules.ensure_compiled(self.products or products)
+        with PASS_SECONDS.time(self.schedule), self.profiler.profile("pass"):
+            outcomes = [outcome for _, _, outcome in self.check_batch(products, wib_time)]
+
+        changed = sum(1 for o in outcomes if o in ("changed", "baseline"))
+        failures = outcomes.count("failed")
         log("info", "Monitor summary",
-            total_products=len(products), changed=changed, failures=failures)
+            total_products=len(products), changed=changed, failures=failures,
+            method_stats=self.router.summary(), response_cache=self.response_cache.summary(),
+            result_sharing=self.results.summary(), open_circuits=self.breakers.summary(),
+            identities=self.identities.summary() if self.identities else None)
         log("info", "Monitor pass ended", wib_time=self.get_wib_time())
 
+    def scheduled_step(self):
+        wait = self.scheduler.seconds_until_next()
+        if wait is None:
+            self._stop.wait(self.scheduler.base_interval)
+            return
+        if self.watchlist is not None and wait > self.watchlist_poll:
+            # Wake up periodically so watchlist edits don't wait for the next due product
+            self._stop.wait(self.watchlist_poll)
+            return
+        if wait > 0 and self._stop.wait(wait):
+            return
+        batch = self.scheduler.pop_due()
+        if not batch:
+            return
+
+        results = []
+        try:
+            with PASS_SECONDS.time(self.schedule), self.profiler.profile("batch"):
+                results = self.check_batch(batch, self.get_wib_time())
+        finally:
+            done = {product_key(p) for p, _, _ in results}
+            for product, info, outcome in results:
+                self.scheduler.reschedule(product, info, outcome)
+            # Anything interrupted mid-batch goes back in the queue; on shutdown it stays due now
+            for product in batch:
+                if product_key(product) not in done:
+                    if self._stop.is_set():
+                        self.scheduler.add(product)
+                    else:
+                        self.scheduler.reschedule(product, None, "failed")
+
+        window = self._window
+        window["checks"] += len(results)
+        window["changed"] += sum(1 for _, _, o in results if o in ("changed", "baseline"))
+        window["failures"] += sum(1 for _, _, o in results if o == "failed")
+        if time.monotonic() - window["started"] >= self.scheduler.base_interval:
+            log("info", "Monitor summary",
+                checks=window["checks"], changed=window["changed"], failures=window["failures"],
+                schedule=self.scheduler.summary(), method_stats=self.router.summary())
+            self._window = {"started": time.monotonic(), "checks": 0, "changed": 0, "failures": 0}
+
+    def apply_watchlist_changes(self) -> bool:
+        """Fold watchlist edits into the running loop; stored baselines are kept for removed products."""
+        if self.watchlist is None:
+            return False
+        diff = self.watchlist.poll()
+        if not diff:
+            return False
+        self.products = self.watchlist.products()
+        self.rules.ensure_compiled(self.products)
+        for product in diff.removed:
+            key = product_key(product)
+            self.variants.drop_item(key)
+            self.snapshots.pop(key, None)
+            self._prior_update.pop(key, None)
+            self.results.discard(key)
+            for method in self.fetch_methods:
+                self.response_cache.discard(f"{method}:{key}")
+            if self.batcher:
+                self.batcher.forget(key)
+            if self.scheduler is not None:
+                self.scheduler.remove(key)
+        if self.scheduler is not None:
+            for product in diff.added:
+                self.scheduler.add(product)
+            for product in diff.updated:
+                self.scheduler.add(product, delay=self.min_interval)
+        log("info", "Watchlist applied", products=len(self.products),
+            added=[product_key(p) for p in diff.added],
+            removed=[product_key(p) for p in diff.removed],
+            updated=[product_key(p) for p in diff.updated])
+        return True
+
+    def request_stop(self, reason: str = ""):
+        """Ask the loop to finish in-flight work, checkpoint and return."""
+        if not self._stop.is_set():
+            log("info", "Stop requested", reason=reason)
+        self._stop.set()
+
+    def _install_signal_handlers(self):
+        # signal.signal only works from the main thread (not under a sharding worker thread)
+        if threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.request_stop(signal.Signals(signum).name))
+
+    def checkpoint(self):
+        """Save scheduler position, rule memory and caches so a restart can pick up from here."""
+        if not self.checkpoint_file:
+            return
+        next_pass_in = None
+        if self._next_pass_at is not None:
+            next_pass_in = max(0.0, self._next_pass_at - time.monotonic())
+        save_checkpoint(self.checkpoint_file, {
+            "schedule": self.schedule,
+            "next_pass_in": next_pass_in,
+            "unfinished": self._unfinished,
+            "scheduler": self.scheduler.export() if self.scheduler is not None else None,
+            "rules": self.rules.export_state(),
+            "response_cache": self.response_cache.export(encode_cached),
+            "snapshots": dict(self.snapshots),
+        })
+        self._checkpointed_at = time.monotonic()
+
+    def restore_checkpoint(self) -> bool:
+        """Apply a recent checkpoint to the freshly built scheduler, rules and caches."""
+        if not self.checkpoint_file:
+            return False
+        data = load_checkpoint(self.checkpoint_file, self.checkpoint_max_age)
+        if data is None:
+            return False
+        age = data["age"]
+        restored = 0
+        if data.get("schedule") == self.schedule:
+            if self.scheduler is not None and data.get("scheduler"):
+                restored = self.scheduler.restore(data["scheduler"], elapsed=age)
+            elif self.scheduler is None and data.get("next_pass_in") is not None:
+                self._next_pass_at = time.monotonic() + max(0.0, data["next_pass_in"] - age)
+                self._unfinished = list(data.get("unfinished") or [])
+        self.rules.restore_state(data.get("rules") or {})
+        self.response_cache.restore(data.get("response_cache") or {}, decode_cached)
+        self.snapshots.update(data.get("snapshots") or {})
+        log("info", "Checkpoint restored", age_seconds=round(age), scheduled=restored,
+            next_pass_in=round(self._next_pass_at - time.monotonic()) if self._next_pass_at else None,
+            unfinished=len(self._unfinished),
+            response_cache=len(self.response_cache), snapshots=len(self.snapshots))
+        return True
+
+    def shutdown(self):
+        """Runs once the loop has stopped: checkpoint, then drain Telegram and close stores."""
+        if self.commands is not None:
+            self.commands.stop()
+        self.checkpoint()
+        if self.variant_file:
+            self.variants.save(self.variant_file)
+        if self.history is not None:
+            self.history.close()
+        drained = self.notifier.flush(self.drain_timeout)
+        self.notifier.stop(timeout=0)
+        self.store.close()
+        log("info", "Shutdown complete", telegram_drained=drained, telegram_pending=self.notifier.pending())
+
     def run_continuous(self, products: list[dict], interval: int = 300):
-        wib_start = self.get_wib_time()
-        self.send_telegram(
-            "🤖 <b>Shopee Monitor Started!</b>\n\n"
-            f"✅ Railway.app deployment active\n"
-            f"📦 Monitoring {len(products)} product(s)\n"
-            f"⏱️  Interval: {interval//60} minute(s)\n"
-            f"🕐 {wib_start} WIB"
-        )
-        log("info", "Continuous loop started", interval_seconds=interval, products=len(products))
-
-        while True:
+        if self.watchlist is not None and len(self.watchlist):
+            products = self.watchlist.products()
+        self.products = products
+        self.rules.ensure_compiled(products)
+        if self.schedule == "adaptive":
+            self.scheduler = PollScheduler(base_interval=interval, min_interval=self.min_interval,
+                                           max_interval=self.max_interval, rpm_budget=self.rpm_budget)
+            self.scheduler.add_all(products)
+            self._window = {"started": time.monotonic(), "checks": 0, "changed": 0, "failures": 0}
+        else:
+            self._next_pass_at = time.monotonic()
+        resumed = self.restore_checkpoint()
+        self._install_signal_handlers()
+
+        if resumed:
+            # A restart picks up where the last run left off; nothing to announce
+            log("info", "Monitor resumed", products=len(products), schedule=self.schedule)
+        else:
+            wib_start = self.get_wib_time()
+            self.send_telegram(
+                "🤖 <b>Shopee Monitor Started!</b>\n\n"
+                f"✅ Railway.app deployment active\n"
+                f"📦 Monitoring {len(products)} product(s)\n"
+                f"⏱️  Interval: {interval//60} minute(s) ({self.schedule})\n"
+                f"🕐 {wib_start} WIB"
+            )
+        log("info", "Continuous loop started", interval_seconds=interval, products=len(products),
+            schedule=self.schedule, rpm_budget=self.rpm_budget, resumed=resumed)
+
+        while not self._stop.is_set():
             try:
-                self.monitor_once(products)
-                log("info", "Sleeping", seconds=interval)
-                time.sleep(interval)
+                self.apply_watchlist_changes()
+                if self.scheduler is not None:
+                    self.scheduled_step()
+                    if time.monotonic() - self._checkpointed_at >= self.checkpoint_every:
+                        self.checkpoint()
+                else:
+                    wait = self._next_pass_at - time.monotonic()
+                    if wait > 0:
+                        self._stop.wait(wait)
+                        continue
+                    products = self.products
+                    if self._unfinished:
+                        # Resuming a pass a stop cut short: finish it rather than sweep everything.
+                        # Only the fetches shrink; rules stay compiled for the full watchlist.
+                        pending = set(self._unfinished)
+                        products = [p for p in self.products if product_key(p) in pending]
+                        self._unfinished = []
+                    self.monitor_once(products)
+                    # The unfinished part of a pass cut short by a stop runs straight after the restart
+                    self._next_pass_at = time.monotonic() + (0 if self._stop.is_set() else interval)
+                    self.checkpoint()
+                    log("info", "Sleeping", seconds=interval)
             except KeyboardInterrupt:
                 log("info", "KeyboardInterrupt - stopping")
                 self.send_telegram(f"🛑 <b>Bot Stopped</b>\n\n🕐 {self.get_wib_time()} WIB")
-                break
+                self._stop.set()
             except Exception as e:
                 log("error", "Unhandled loop exception", error=str(e),
                     stack=traceback.format_exc().splitlines()[-5:])
                 self.send_telegram(
                     f"⚠️ <b>Loop Error</b>\n{str(e)}\nRetrying in 60s\n🕐 {self.get_wib_time()} WIB"
                 )
-                time.sleep(60)
+                self._stop.wait(60)
+        self.shutdown()
 
 def validate_env():
     missing = [v for v in ["TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"] if not os.getenv(v)]
@@ -252,6 +638,9 @@ def validate_env():
     log("info", "Environment OK", vars="present")
 
 if __name__ == "__main__":
+    configure_logging(level=os.getenv("LOG_LEVEL", "info"),
+                      sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "1")),
+                      async_writer=os.getenv("LOG_ASYNC", "1") != "0")
     print("=" * 60)
     print("🚀 SHOPEE TELEGRAM MONITOR - RAILWAY")
     print("=" * 60)
@@ -260,15 +649,95 @@ if __name__ == "__main__":
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
     CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "300"))
+    MONITOR_MODE = os.getenv("MONITOR_MODE", "serial").lower()
+    CONCURRENCY = int(os.getenv("CONCURRENCY", "8"))
+    HOST_RATE_LIMITS = parse_host_rates(os.getenv("HOST_RATE_LIMITS", ""))
+    BATCH_SIZE = int(os.getenv("BATCH_SIZE", "50"))
+    COOKIE_FILE = os.getenv("COOKIE_FILE", "shopee_cookies.json")
+    COOKIE_MAX_AGE = int(os.getenv("COOKIE_MAX_AGE", "1800"))
+    STATE_BACKEND = os.getenv("STATE_BACKEND", "json").lower()
+    SCHEDULE = os.getenv("SCHEDULE", "fixed").lower()
+    RPM_BUDGET = float(os.getenv("RPM_BUDGET", "0")) or None
+    MIN_INTERVAL = int(os.getenv("MIN_INTERVAL", "30"))
+    MAX_INTERVAL = int(os.getenv("MAX_INTERVAL", "3600"))
+    OUTBOX_FILE = os.getenv("OUTBOX_FILE", "telegram_outbox.json")
+    DIGEST_THRESHOLD = int(os.getenv("DIGEST_THRESHOLD", "5"))
+    VARIANT_FILE = os.getenv("VARIANT_FILE", "variant_index.bin")
+    WATCHLIST_FILE = os.getenv("WATCHLIST_FILE", "watchlist.json")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    PROFILE_DIR = os.getenv("PROFILE_DIR") or None
+    BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+    BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+    HISTORY_DIR = os.getenv("HISTORY_DIR", "history") or None
+    HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+    HISTORY_MAX_MB = int(os.getenv("HISTORY_MAX_MB", "200"))
+    RESULT_TTL = float(os.getenv("RESULT_TTL", "15"))
+    CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "monitor_checkpoint.json") or None
+    CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", "86400"))
+    DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+    ENABLE_COMMANDS = os.getenv("BOT_COMMANDS", "1") != "0"
+    COMMAND_CHAT_IDS = [c.strip() for c in os.getenv("COMMAND_CHAT_IDS", "").split(",") if c.strip()]
+    IDENTITIES_FILE = os.getenv("IDENTITIES_FILE") or None
+    IDENTITIES = (load_identity_specs(IDENTITIES_FILE) if IDENTITIES_FILE
+                  else identity_specs(os.getenv("PROXIES", ""), os.getenv("IDENTITY_PROFILES", "")))
+    STATE_FILE = os.getenv("STATE_FILE",
+                           "product_state.db" if STATE_BACKEND == "sqlite" else "product_state.json")
 
     log("info", "Startup config",
         interval_seconds=CHECK_INTERVAL,
-        interval_minutes=CHECK_INTERVAL // 60)
+        interval_minutes=CHECK_INTERVAL // 60,
+        mode=MONITOR_MODE,
+        schedule=SCHEDULE,
+        concurrency=CONCURRENCY,
+        batch_size=BATCH_SIZE)
 
     PRODUCTS = [
         {"shop_id": "581472460", "item_id": "28841260015"}
         # Tambah produk lain di sini jika perlu
     ]
 
-    monitor = ShopeeMonitor(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID)
-    monitor.run_continuous(PRODUCTS, interval=CHECK_INTERVAL)
+    NUM_WORKERS = int(os.getenv("NUM_WORKERS", "1"))
+    WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+    if NUM_WORKERS > 1:
+        # Replicas may share a host (and volume); every single-writer file gets its own copy
+        STATE_FILE = worker_path(STATE_FILE, WORKER_INDEX)
+        OUTBOX_FILE = worker_path(OUTBOX_FILE, WORKER_INDEX)
+        VARIANT_FILE = worker_path(VARIANT_FILE, WORKER_INDEX)
+        COOKIE_FILE = worker_path(COOKIE_FILE, WORKER_INDEX)
+        if HISTORY_DIR:
+            HISTORY_DIR = os.path.join(HISTORY_DIR, f"worker{WORKER_INDEX}")
+
+    monitor = ShopeeMonitor(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, state_file=STATE_FILE,
+                            state_backend=STATE_BACKEND, mode=MONITOR_MODE, concurrency=CONCURRENCY,
+                            host_rates=HOST_RATE_LIMITS, batch_size=BATCH_SIZE,
+                            cookie_file=COOKIE_FILE, cookie_max_age=COOKIE_MAX_AGE,
+                            schedule=SCHEDULE, rpm_budget=RPM_BUDGET,
+                            min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                            outbox_file=OUTBOX_FILE, digest_threshold=DIGEST_THRESHOLD,
+                            variant_file=VARIANT_FILE, watchlist_file=WATCHLIST_FILE,
+                            profile_dir=PROFILE_DIR, breaker_threshold=BREAKER_THRESHOLD,
+                            breaker_reset=BREAKER_RESET, history_dir=HISTORY_DIR,
+                            history_retention_days=HISTORY_RETENTION_DAYS,
+                            history_max_bytes=HISTORY_MAX_MB * 1024 * 1024,
+                            identities=IDENTITIES or None, result_ttl=RESULT_TTL,
+                            checkpoint_file=CHECKPOINT_FILE if NUM_WORKERS == 1 else None,
+                            checkpoint_max_age=CHECKPOINT_MAX_AGE, drain_timeout=DRAIN_TIMEOUT)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, host=METRICS_HOST)
+    if monitor.watchlist is not None and len(monitor.watchlist):
+        PRODUCTS = monitor.watchlist.products()
+    if ENABLE_COMMANDS and NUM_WORKERS == 1:
+        # Only one getUpdates poller per bot token; sharded replicas leave commands off
+        monitor.commands = TelegramCommands(monitor, monitor.telegram_api, [TELEGRAM_CHAT_ID, *COMMAND_CHAT_IDS])
+        monitor.commands.start()
+    if NUM_WORKERS > 1:
+        # Sharded replica: owns shards via leases in a shared coordinator DB
+        worker = ShardWorker(monitor, SqliteCoordinator(os.getenv("COORDINATOR_DB", "coordinator.db")),
+                             PRODUCTS, WORKER_INDEX, NUM_WORKERS,
+                             num_shards=int(os.getenv("NUM_SHARDS", "0")) or None,
+                             state_dir=os.getenv("STATE_DIR", "."), state_backend=STATE_BACKEND,
+                             lease_ttl=float(os.getenv("LEASE_TTL", str(CHECK_INTERVAL * 3))))
+        worker.run(interval=CHECK_INTERVAL)
+    else:
+        monitor.run_continuous(PRODUCTS, interval=CHECK_INTERVAL)
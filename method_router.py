@@ -0,0 +1,99 @@
+import time
+import threading
+from collections import deque
+
+from logutil import log
+from metrics import FETCHES, FETCH_SECONDS
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class MethodStats:
+    __slots__ = ("samples", "last_tried")
+
+    def __init__(self, window: int):
+        self.samples: deque[tuple[bool, float]] = deque(maxlen=window)
+        self.last_tried = time.monotonic()
+
+    def success_rate(self) -> float:
+        # Laplace-smoothed so untried methods start at 0.5 instead of 0 or 1
+        ok = sum(1 for success, _ in self.samples if success)
+        return (ok + 1) / (len(self.samples) + 2)
+
+    def latency(self, pct: float) -> float | None:
+        return _percentile([lat for _, lat in self.samples], pct)
+
+    def summary(self) -> dict:
+        p50 = self.latency(50)
+        p95 = self.latency(95)
+        return {
+            "calls": len(self.samples),
+            "success_rate": round(self.success_rate(), 3),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
+
+# ========= Adaptive Fetch-Method Router =========
+class MethodRouter:
+    """Orders fetch methods by rolling success rate, then p50 latency.
+
+    Stats cover the last `window` calls of each method. A method that is not
+    currently first is moved to the front once every `probe_interval` seconds
+    so a recovered method can win its place back.
+    """
+
+    def __init__(self, methods: list[str], window: int = 50, probe_interval: float = 300):
+        self.methods = list(methods)
+        self.probe_interval = probe_interval
+        self.stats = {name: MethodStats(window) for name in self.methods}
+        self._lock = threading.Lock()
+
+    def _rank_key(self, name: str):
+        stats = self.stats[name]
+        p50 = stats.latency(50)
+        return (-round(stats.success_rate(), 1), p50 if p50 is not None else 0.0, self.methods.index(name))
+
+    def order(self) -> list[str]:
+        with self._lock:
+            ranked = sorted(self.methods, key=self._rank_key)
+            now = time.monotonic()
+            for name in ranked[1:]:
+                if now - self.stats[name].last_tried >= self.probe_interval:
+                    ranked.remove(name)
+                    ranked.insert(0, name)
+                    # Claim the probe slot so concurrent callers don't all probe
+                    self.stats[name].last_tried = now
+                    break
+            return ranked
+
+    def record(self, name: str, success: bool, latency: float):
+        FETCHES.inc(name, "ok" if success else "fail")
+        FETCH_SECONDS.observe(latency, name)
+        with self._lock:
+            stats = self.stats[name]
+            stats.samples.append((success, latency))
+            stats.last_tried = time.monotonic()
+
+    def run(self, methods: dict, *args) -> dict | None:
+        """Call methods in ranked order until one returns a result."""
+        for name in self.order():
+            started = time.monotonic()
+            try:
+                result = methods[name](*args)
+            except Exception as e:
+                log("warning", "Fetch method raised", method=name, error=str(e))
+                result = None
+            self.record(name, result is not None, time.monotonic() - started)
+            if result is not None:
+                return result
+        return None
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {name: self.stats[name].summary() for name in self.methods}
@@ -0,0 +1,264 @@
+import os
+import time
+import pstats
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logutil import log
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry: Registry | None = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Settable gauge; `set_function` reads the value lazily at scrape time."""
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, fn, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = fn
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        out = []
+        for key, value in items:
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    log("warning", "Gauge callback failed", metric=self.name, error=str(e))
+                    continue
+            out.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return out
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 registry: Registry | None = None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        out = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                out.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            out.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            out.append(f"{self.name}_count{labels} {cumulative}")
+        return out
+
+
+# ========= Monitor Metrics =========
+FETCHES = Counter("shopee_fetch_total", "Product fetch attempts by method and result",
+                  ("method", "result"))
+FETCH_SECONDS = Histogram("shopee_fetch_seconds", "Product fetch latency by method", ("method",))
+HTTP_RESPONSES = Counter("shopee_http_responses_total", "HTTP responses by caller tag and status class",
+                         ("tag", "status_class"))
+BREAKER_TRANSITIONS = Counter("shopee_circuit_transitions_total", "Circuit breaker state changes per endpoint",
+                              ("endpoint", "state"))
+IDENTITY_REQUESTS = Counter("shopee_identity_requests_total", "Pooled requests by identity and outcome",
+                            ("identity", "outcome"))
+IDENTITY_HEALTH = Gauge("shopee_identity_health", "Health score of each pooled identity", ("identity",))
+HTTP_SECONDS = Histogram("shopee_http_request_seconds", "HTTP round-trip time by caller tag", ("tag",))
+PASS_SECONDS = Histogram("shopee_pass_seconds", "Duration of a monitor pass or scheduled batch",
+                         ("schedule",), buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+CHECKS = Counter("shopee_checks_total", "Processed product checks by outcome", ("outcome",))
+RESULT_SHARING = Counter("shopee_result_sharing_total",
+                         "Product lookups by how they were served: fetched, shared in-flight or cached",
+                         ("result",))
+QUEUE_DEPTH = Gauge("shopee_queue_depth", "Items waiting in internal queues", ("queue",))
+TELEGRAM_SECONDS = Histogram("telegram_send_seconds", "Telegram sendMessage latency")
+TELEGRAM_MESSAGES = Counter("telegram_messages_total", "Telegram send results", ("result",))
+BOT_COMMANDS = Counter("telegram_commands_total", "Bot commands handled by command and result",
+                       ("command", "result"))
+STATE_SECONDS = Histogram("state_store_seconds", "State store operation latency", ("backend", "op"),
+                          buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+# ========= /metrics Endpoint =========
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: Registry | None = None):
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or REGISTRY})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log("info", "Metrics endpoint listening", url=f"http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+# ========= Per-Pass Profiling =========
+class PassProfiler:
+    """cProfile each pass into `directory`, keeping only the newest `keep` dumps.
+
+    cProfile only sees the calling thread; in async mode the fetches run on
+    pool threads, so profile with MONITOR_MODE=serial to see them.
+    """
+
+    def __init__(self, directory: str | None, keep: int = 20, top: int = 10):
+        self.directory = directory
+        self.keep = keep
+        self.top = top
+        self._count = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, label: str):
+        if not self.directory:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._count += 1
+            path = os.path.join(self.directory, f"pass-{time.strftime('%Y%m%d-%H%M%S')}-{self._count}-{label}.prof")
+            profiler.dump_stats(path)
+            stats = pstats.Stats(profiler).sort_stats("cumulative")
+            top = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:self.top]
+            hot = [f"{fn[2]} ({os.path.basename(fn[0])}:{fn[1]}) {row[2]:.3f}s" for fn, row in top]
+            log("info", "Pass profile saved", path=path, total_seconds=round(stats.total_tt, 3),
+                top_self_time=hot)
+            self._prune()
+
+    def _prune(self):
+        dumps = sorted((f for f in os.listdir(self.directory) if f.endswith(".prof")),
+                       key=lambda f: os.path.getmtime(os.path.join(self.directory, f)))
+        for name in dumps[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logutil import log
+from http_client import parse_retry_after
+from metrics import TELEGRAM_MESSAGES, TELEGRAM_SECONDS
+
+TELEGRAM_MAX_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+# ========= Telegram Outbound Queue =========
+class TelegramDispatcher:
+    """Background Telegram sender with per-chat pacing and retry.
+
+    Messages are queued and sent from one worker thread over a pooled
+    session. A 429 is retried after the `retry_after` Telegram returns;
+    network errors and 5xx back off exponentially up to `max_attempts`.
+    Inside `collect()`, messages are held and merged into a digest for any
+    chat that gets more than `digest_threshold` of them. Undelivered messages are kept in
+    `outbox_file` so they survive a restart.
+    """
+
+    def __init__(self, api_base: str, chat_id: str, outbox_file: str | None = None,
+                 digest_threshold: int = 5, per_chat_interval: float = 1.0,
+                 max_attempts: int = 5, session: requests.Session | None = None):
+        self.api_base = api_base
+        self.chat_id = chat_id
+        self.outbox_file = outbox_file
+        self.digest_threshold = digest_threshold
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.session = session or requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.sent = 0
+        self.failed = 0
+        self._queue: deque[dict] = deque()
+        self._collecting: list[list[dict]] = []
+        self._sending: dict | None = None
+        self._last_sent: dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._load_outbox()
+        self._worker = threading.Thread(target=self._run, name="telegram-dispatcher", daemon=True)
+        self._worker.start()
+
+    # ----- queueing -----
+    def enqueue(self, text: str, chat_id: str | None = None, hold: bool = True):
+        """Queue a message; with `hold=False` it skips any open `collect()` (e.g. command replies)."""
+        if not text or text.strip() == "":
+            text = "<EMPTY_MESSAGE>"
+        msg = {"chat_id": str(chat_id or self.chat_id), "text": text, "attempts": 0, "not_before": 0.0}
+        with self._cond:
+            if hold and self._collecting:
+                self._collecting[-1].append(msg)
+                # Held alerts are in the outbox too, so a crash mid-pass doesn't lose them
+                self._persist()
+                return
+            self._queue.append(msg)
+            self._persist()
+            self._cond.notify()
+
+    def hold(self):
+        """Start holding enqueued messages until the matching `release()`."""
+        with self._cond:
+            self._collecting.append([])
+
+    def release(self):
+        """Queue held messages, merged into digests if there are too many."""
+        with self._cond:
+            held = self._collecting.pop()
+            for msg in self._merge(held):
+                if self._collecting:
+                    self._collecting[-1].append(msg)
+                else:
+                    self._queue.append(msg)
+            self._persist()
+            self._cond.notify()
+
+    @contextmanager
+    def collect(self):
+        self.hold()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def _merge(self, held: list[dict]) -> list[dict]:
+        by_chat: dict[str, list[dict]] = {}
+        for msg in held:
+            by_chat.setdefault(msg["chat_id"], []).append(msg)
+        merged = []
+        for chat_id, msgs in by_chat.items():
+            if len(msgs) <= self.digest_threshold:
+                merged.extend(msgs)
+                continue
+            texts = [m["text"] for m in msgs]
+            header = f"📣 <b>{len(texts)} PERUBAHAN STOK</b>"
+            current = header
+            for text in texts:
+                candidate = current + DIGEST_SEPARATOR + text
+                if len(candidate) > TELEGRAM_MAX_LENGTH and current != header:
+                    merged.append({"chat_id": chat_id, "text": current, "attempts": 0, "not_before": 0.0})
+                    current = header + " (lanjutan)" + DIGEST_SEPARATOR + text
+                else:
+                    current = candidate
+            merged.append({"chat_id": chat_id, "text": current, "attempts": 0, "not_before": 0.0})
+            log("info", "Telegram digest built", chat_id=chat_id, changes=len(texts))
+        return merged
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue) + (1 if self._sending else 0)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until everything queued has been sent or dropped."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._sending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.5))
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._persist()
+            self._cond.notify_all()
+        self._worker.join(timeout=1.0)
+
+    # ----- worker -----
+    def _next_ready(self) -> tuple[dict | None, float]:
+        now = time.monotonic()
+        soonest = None
+        seen = set()
+        for msg in self._queue:
+            # Only the oldest message per chat is eligible, keeping chats in order
+            if msg["chat_id"] in seen:
+                continue
+            seen.add(msg["chat_id"])
+            ready_at = max(msg["not_before"],
+                           self._last_sent.get(msg["chat_id"], 0.0) + self.per_chat_interval)
+            if ready_at <= now:
+                return msg, 0.0
+            soonest = ready_at if soonest is None else min(soonest, ready_at)
+        return None, (soonest - now) if soonest is not None else 1.0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    msg, wait = self._next_ready()
+                    if msg is not None:
+                        break
+                    self._cond.wait(wait)
+                self._queue.remove(msg)
+                self._sending = msg
+            outcome, retry_in = "drop", 0.0
+            try:
+                outcome, retry_in = self._send(msg)
+            except Exception as e:
+                # Never let one bad response kill the worker while enqueue keeps accepting
+                log("error", "Telegram send raised", error=str(e), attempt=msg["attempts"])
+                TELEGRAM_MESSAGES.inc("error")
+                outcome, retry_in = self._retry_or_drop(msg, 2 ** msg["attempts"])
+            finally:
+                with self._cond:
+                    self._sending = None
+                    self._last_sent[msg["chat_id"]] = time.monotonic()
+                    if outcome == "retry":
+                        msg["not_before"] = time.monotonic() + retry_in
+                        self._queue.appendleft(msg)
+                    self._persist()
+                    self._cond.notify_all()
+
+    def _send(self, msg: dict) -> tuple[str, float]:
+        msg["attempts"] += 1
+        payload = {
+            "chat_id": msg["chat_id"],
+            "text": msg["text"],
+            "parse_mode": "HTML",
+            "disable_web_page_preview": False
+        }
+        started = time.monotonic()
+        try:
+            resp = self.session.post(f"{self.api_base}/sendMessage", json=payload, timeout=30)
+        except Exception as e:
+            log("error", "Telegram exception", error=str(e), attempt=msg["attempts"])
+            TELEGRAM_MESSAGES.inc("error")
+            return self._retry_or_drop(msg, 2 ** msg["attempts"])
+        TELEGRAM_SECONDS.observe(time.monotonic() - started)
+
+        if resp.status_code == 200:
+            self.sent += 1
+            TELEGRAM_MESSAGES.inc("sent")
+            log("info", "Telegram sent", length=len(msg["text"]),
+                ms=round((time.monotonic() - started) * 1000))
+            return "ok", 0.0
+        if resp.status_code == 429:
+            retry_after = None
+            try:
+                body = resp.json()
+            except ValueError:
+                body = None
+            if isinstance(body, dict) and isinstance(body.get("parameters"), dict):
+                retry_after = body["parameters"].get("retry_after")
+            if not isinstance(retry_after, (int, float)):
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if retry_after is None:
+                retry_after = 1
+            log("warning", "Telegram rate limited", retry_after=retry_after, attempt=msg["attempts"])
+            TELEGRAM_MESSAGES.inc("rate_limited")
+            # Throttling is not the message's fault, so it doesn't use up an attempt
+            msg["attempts"] -= 1
+            return "retry", float(retry_after)
+        if resp.status_code >= 500:
+            log("warning", "Telegram server error", status_code=resp.status_code, attempt=msg["attempts"])
+            TELEGRAM_MESSAGES.inc("server_error")
+            return self._retry_or_drop(msg, 2 ** msg["attempts"])
+        log("error", "Telegram failed", status_code=resp.status_code, body=resp.text[:250])
+        self.failed += 1
+        TELEGRAM_MESSAGES.inc("failed")
+        return "drop", 0.0
+
+    def _retry_or_drop(self, msg: dict, backoff: float) -> tuple[str, float]:
+        if msg["attempts"] >= self.max_attempts:
+            log("error", "Telegram message dropped", attempts=msg["attempts"], length=len(msg["text"]))
+            self.failed += 1
+            TELEGRAM_MESSAGES.inc("failed")
+            return "drop", 0.0
+        return "retry", min(backoff, 60.0)
+
+    # ----- persistence -----
+    def _persist(self):
+        if not self.outbox_file:
+            return
+        queued = ([self._sending] if self._sending else []) + list(self._queue)
+        pending = [{"chat_id": m["chat_id"], "text": m["text"], "attempts": m["attempts"]}
+                   for m in queued]
+        for group in self._collecting:
+            pending.extend({"chat_id": m["chat_id"], "text": m["text"], "attempts": m["attempts"]}
+                           for m in group)
+        try:
+            if not pending:
+                if os.path.exists(self.outbox_file):
+                    os.remove(self.outbox_file)
+                return
+            tmp = f"{self.outbox_file}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(pending, f)
+            os.replace(tmp, self.outbox_file)
+        except Exception as e:
+            log("warning", "Failed saving Telegram outbox", error=str(e))
+
+    def _load_outbox(self):
+        if not self.outbox_file or not os.path.exists(self.outbox_file):
+            return
+        try:
+            with open(self.outbox_file, "r") as f:
+                for m in json.load(f):
+                    self._queue.append({"chat_id": m["chat_id"], "text": m["text"],
+                                        "attempts": m.get("attempts", 0), "not_before": 0.0})
+            log("info", "Telegram outbox restored", pending=len(self._queue))
+        except Exception as e:
+            log("warning", "Failed loading Telegram outbox", error=str(e))
@@ -0,0 +1,50 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logutil import log
+
+# Placeholder result for products not fetched because a shutdown was requested
+SKIPPED = object()
+
+# ========= Concurrent Polling Engine =========
+class AsyncPoller:
+    """Runs a blocking `fetch(shop_id, item_id)` for many products at once.
+
+    Fetches are dispatched onto a dedicated thread pool sized to `concurrency`
+    so they can share one pooled `requests.Session`; results come back in the
+    same order as the input products. Once `should_stop()` returns True,
+    fetches already running finish but queued ones come back as `SKIPPED`.
+    """
+
+    def __init__(self, fetch, concurrency: int = 8, should_stop=None):
+        self.fetch = fetch
+        self.concurrency = max(1, int(concurrency))
+        self.should_stop = should_stop
+
+    async def _fetch_one(self, loop, executor, sem, product: dict):
+        async with sem:
+            if self.should_stop is not None and self.should_stop():
+                return SKIPPED
+            try:
+                return await loop.run_in_executor(
+                    executor, self.fetch, product["shop_id"], product["item_id"])
+            except Exception as e:
+                log("error", "Async fetch exception",
+                    shop_id=product["shop_id"], item_id=product["item_id"], error=str(e))
+                return None
+
+    async def gather(self, products: list[dict]) -> list[tuple[dict, dict | None]]:
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="poller") as executor:
+            infos = await asyncio.gather(
+                *(self._fetch_one(loop, executor, sem, p) for p in products))
+        log("info", "Async fetch completed", products=len(products),
+            concurrency=self.concurrency, seconds=round(time.monotonic() - started, 2))
+        return list(zip(products, infos))
+
+    def run(self, products: list[dict]) -> list[tuple[dict, dict | None]]:
+        return asyncio.run(self.gather(products))
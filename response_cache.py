@@ -0,0 +1,84 @@
+import hashlib
+import threading
+
+
+def fingerprint(body: bytes) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+class CacheEntry:
+    __slots__ = ("etag", "last_modified", "fingerprint", "value")
+
+    def __init__(self, etag, last_modified, fingerprint, value):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fingerprint = fingerprint
+        self.value = value
+
+# ========= Conditional / Delta Fetch Cache =========
+class ResponseCache:
+    """Remembers validators and a body fingerprint per cache key.
+
+    `conditional_headers()` adds If-None-Match / If-Modified-Since when the
+    server gave us validators. `lookup()` returns the previously parsed value
+    when the response is a 304 or its raw body hashes the same as last time,
+    so the caller can skip JSON decoding and state comparison.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def conditional_headers(self, key: str) -> dict:
+        entry = self._entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def lookup(self, key: str, resp):
+        entry = self._entries.get(key)
+        if entry is None or resp is None:
+            return None
+        if resp.status_code == 304 or (
+                resp.status_code == 200 and fingerprint(resp.content) == entry.fingerprint):
+            with self._lock:
+                self.hits += 1
+            return entry.value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key: str, resp, value):
+        entry = CacheEntry(resp.headers.get("ETag"), resp.headers.get("Last-Modified"),
+                           fingerprint(resp.content), value)
+        with self._lock:
+            self._entries[key] = entry
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def export(self, encode) -> dict:
+        """Entries as JSON-ready lists; `encode` turns a cached value into JSON data."""
+        with self._lock:
+            entries = list(self._entries.items())
+        return {k: [e.etag, e.last_modified, e.fingerprint.hex(), encode(e.value)] for k, e in entries}
+
+    def restore(self, data: dict, decode):
+        with self._lock:
+            for key, (etag, last_modified, digest, value) in data.items():
+                self._entries[key] = CacheEntry(etag, last_modified, bytes.fromhex(digest), decode(value))
+
+    def summary(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None}
@@ -0,0 +1,205 @@
+from array import array
+
+from logutil import log
+from batching import product_key
+
+RULE_TYPES = ("price_below", "drop_pct", "stock_below", "back_in_stock")
+
+
+class RuleHit:
+    __slots__ = ("product", "rule", "threshold", "info", "reference")
+
+    def __init__(self, product, rule, threshold, info, reference=None):
+        self.product = product
+        self.rule = rule
+        self.threshold = threshold
+        self.info = info
+        self.reference = reference
+
+
+class _RuleColumn:
+    """All rules of one type: product slot and threshold side by side."""
+    __slots__ = ("slots", "thresholds")
+
+    def __init__(self):
+        self.slots = array("l")
+        self.thresholds = array("d")
+
+
+class _RuleMemory:
+    """What the rules remember about one product between passes."""
+    __slots__ = ("stock", "ref", "active")
+
+    def __init__(self, stock: int = -1, ref: float = 0.0, active: dict | None = None):
+        self.stock = stock
+        self.ref = ref
+        self.active = active or {}
+
+# ========= Bulk Alert Rules Engine =========
+class RuleEngine:
+    """Compiles per-product `rules` once and evaluates them column by column.
+
+    A product opts in with e.g.
+    `{"rules": {"price_below": 150000, "drop_pct": 10, "stock_below": 3, "back_in_stock": true}}`.
+    Rules are edge-triggered: a hit fires when its condition turns true and
+    re-arms once it turns false again. `drop_pct` is measured against the
+    highest price seen since it last fired.
+
+    Memory is kept per product key, so recompiling for an edited watchlist
+    only forgets products that left it.
+    """
+
+    def __init__(self):
+        self._source = None
+        self._slots: dict[str, int] = {}
+        self._products: list[dict] = []
+        self._columns: dict[str, _RuleColumn] = {}
+        self._memory: dict[str, _RuleMemory] = {}
+        self._states: list[_RuleMemory] = []
+        self.rule_count = 0
+
+    def covers_flip(self, product: dict, available: bool) -> bool:
+        """True if one of the product's rules already alerts on this availability flip.
+
+        Only a restock is covered (by `back_in_stock`); no rule fires on a sell-out.
+        """
+        return bool(available and (product.get("rules") or {}).get("back_in_stock"))
+
+    def ensure_compiled(self, products: list[dict]):
+        if products is not self._source:
+            self.compile(products)
+
+    def compile(self, products: list[dict]):
+        """Compile the whole watchlist; `products` must not be a subset of it."""
+        memory = {}
+        self._source = products
+        self._slots = {}
+        self._products = []
+        self._columns = {rule: _RuleColumn() for rule in RULE_TYPES}
+        self._states = []
+        count = 0
+        for product in products:
+            rules = product.get("rules") or {}
+            if not rules:
+                continue
+            key = product_key(product)
+            slot = len(self._products)
+            self._slots[key] = slot
+            self._products.append(product)
+            state = memory[key] = self._memory.get(key) or _RuleMemory()
+            self._states.append(state)
+            for rule, threshold in rules.items():
+                if rule not in RULE_TYPES:
+                    log("warning", "Unknown rule ignored", key=key, rule=rule)
+                    continue
+                if threshold is False or threshold is None:
+                    continue
+                col = self._columns[rule]
+                col.slots.append(slot)
+                col.thresholds.append(float(threshold) if threshold is not True else 0.0)
+                count += 1
+        self._memory = memory
+        self.rule_count = count
+        log("info", "Rules compiled", products=len(self._products), rules=count)
+
+    def evaluate(self, results: list[tuple[dict, dict | None, str]]) -> list[RuleHit]:
+        if not self.rule_count:
+            return []
+        n = len(self._products)
+        price = array("d", [-1.0]) * n
+        stock = array("l", [-1]) * n
+        infos: list[dict | None] = [None] * n
+        for product, info, _ in results:
+            slot = self._slots.get(product_key(product))
+            if slot is None or not info:
+                continue
+            price[slot] = float(info.get("price") or 0)
+            stock[slot] = int(info.get("stock") or 0)
+            infos[slot] = info
+
+        hits = []
+        states = self._states
+
+        col = self._columns["price_below"]
+        for slot, limit in zip(col.slots, col.thresholds):
+            if stock[slot] < 0:
+                continue
+            now = 0 < price[slot] < limit
+            if now and not states[slot].active.get("price_below"):
+                hits.append(RuleHit(self._products[slot], "price_below", limit, infos[slot]))
+            states[slot].active["price_below"] = now
+
+        col = self._columns["drop_pct"]
+        for slot, pct in zip(col.slots, col.thresholds):
+            p = price[slot]
+            state = states[slot]
+            if stock[slot] < 0 or p <= 0:
+                continue
+            if state.ref <= 0 or p > state.ref:
+                state.ref = p
+                continue
+            if p <= state.ref * (1 - pct / 100):
+                hits.append(RuleHit(self._products[slot], "drop_pct", pct, infos[slot], reference=state.ref))
+                state.ref = p
+
+        col = self._columns["stock_below"]
+        for slot, limit in zip(col.slots, col.thresholds):
+            if stock[slot] < 0:
+                continue
+            now = 0 < stock[slot] < limit
+            if now and not states[slot].active.get("stock_below"):
+                hits.append(RuleHit(self._products[slot], "stock_below", limit, infos[slot]))
+            states[slot].active["stock_below"] = now
+
+        col = self._columns["back_in_stock"]
+        for slot in col.slots:
+            if stock[slot] < 0:
+                continue
+            if states[slot].stock == 0 and stock[slot] > 0:
+                hits.append(RuleHit(self._products[slot], "back_in_stock", 0, infos[slot]))
+
+        for slot in range(n):
+            if stock[slot] >= 0:
+                states[slot].stock = stock[slot]
+        return hits
+
+    def export_state(self) -> dict:
+        """Per-product rule memory (last stock, reference price, armed flags) for a checkpoint."""
+        return {key: {"stock": m.stock, "ref": m.ref, "active": {r: int(a) for r, a in m.active.items()}}
+                for key, m in self._memory.items()}
+
+    def restore_state(self, state: dict):
+        """Seed rule memory from a checkpoint so restarts don't re-fire them.
+
+        Works before or after `compile`; keys the next compile doesn't see are dropped then.
+        """
+        for key, saved in state.items():
+            memory = self._memory.setdefault(key, _RuleMemory())
+            # Update in place: compiled slots hold references to these objects
+            memory.stock = int(saved.get("stock", -1))
+            memory.ref = float(saved.get("ref", 0.0))
+            memory.active = {rule: bool(a) for rule, a in (saved.get("active") or {}).items()}
+
+
+def format_rule_hit(hit: RuleHit, wib_time: str) -> str:
+    info = hit.info
+    product = hit.product
+    if hit.rule == "price_below":
+        title = "💸 <b>HARGA DI BAWAH TARGET!</b>"
+        detail = f"💰 Rp {info['price']:,.0f} (target &lt; Rp {hit.threshold:,.0f})"
+    elif hit.rule == "drop_pct":
+        title = f"💸 <b>HARGA TURUN {hit.threshold:g}%+!</b>"
+        detail = f"💰 Rp {hit.reference:,.0f} → Rp {info['price']:,.0f}"
+    elif hit.rule == "stock_below":
+        title = "⚠️ <b>STOK MENIPIS!</b>"
+        detail = f"📊 Stok: {info['stock']} unit (&lt; {hit.threshold:g})"
+    else:
+        title = "✅ <b>PRODUK READY!</b>"
+        detail = f"📊 Stok: {info['stock']} unit"
+    return (
+        f"{title}\n\n"
+        f"📦 <b>{info['name']}</b>\n"
+        f"{detail}\n"
+        f"🕐 {wib_time} WIB\n\n"
+        f"🔗 <a href='https://shopee.co.id/product/{product['shop_id']}/{product['item_id']}'>BELI SEKARANG!</a>"
+    )
@@ -0,0 +1,182 @@
+import heapq
+import time
+
+from batching import product_key
+
+
+class ProductSchedule:
+    __slots__ = ("product", "base", "interval", "next_due", "version")
+
+    def __init__(self, product: dict, base: float, next_due: float):
+        self.product = product
+        self.base = base
+        self.interval = base
+        self.next_due = next_due
+        self.version = 0
+
+# ========= Adaptive Polling Scheduler =========
+class PollScheduler:
+    """Priority queue of per-product next-check times.
+
+    Intervals shrink to `min_interval` right after a change and to a quarter
+    of the base interval while stock is at or below `low_stock`; stable
+    products back off by `backoff` per unchanged check up to `max_interval`.
+    An optional `rpm_budget` caps checks per minute with a token bucket so
+    checks trickle out instead of bursting. A product's own `interval` field
+    replaces the base interval for that product.
+    """
+
+    def __init__(self, base_interval: float = 300, min_interval: float = 30,
+                 max_interval: float = 3600, backoff: float = 1.5, low_stock: int = 3,
+                 rpm_budget: float | None = None, clock=time.monotonic):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.backoff = backoff
+        self.low_stock = low_stock
+        self.rpm_budget = rpm_budget
+        self.clock = clock
+        self._heap: list[tuple[float, int, str, int]] = []
+        self._entries: dict[str, ProductSchedule] = {}
+        self._seq = 0
+        # Token bucket holds at most five seconds' worth of budget
+        self._capacity = max(1.0, rpm_budget / 12) if rpm_budget else 0.0
+        self._tokens = self._capacity
+        self._refilled_at = clock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _push(self, key: str, entry: ProductSchedule):
+        entry.version += 1
+        self._seq += 1
+        heapq.heappush(self._heap, (entry.next_due, self._seq, key, entry.version))
+
+    def add(self, product: dict, delay: float = 0.0, interval: float | None = None):
+        key = product_key(product)
+        base = interval or product.get("interval") or self.base_interval
+        base = max(self.min_interval, min(self.max_interval, base))
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = ProductSchedule(product, base, self.clock() + delay)
+            self._entries[key] = entry
+        else:
+            if base != entry.base:
+                entry.base = entry.interval = base
+            entry.product = product
+            entry.next_due = self.clock() + delay
+        self._push(key, entry)
+
+    def add_all(self, products: list[dict]):
+        """Stagger products evenly across one base interval."""
+        step = self.base_interval / max(1, len(products))
+        for idx, product in enumerate(products):
+            self.add(product, delay=idx * step)
+
+    def remove(self, key: str):
+        # Stale heap entries are skipped lazily when popped
+        self._entries.pop(key, None)
+
+    def _peek(self) -> tuple[float, str] | None:
+        while self._heap:
+            due, _, key, version = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                return due, key
+            heapq.heappop(self._heap)
+        return None
+
+    def _refill(self, now: float):
+        if not self.rpm_budget:
+            return
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self.rpm_budget / 60)
+        self._refilled_at = now
+
+    def seconds_until_next(self) -> float | None:
+        head = self._peek()
+        if head is None:
+            return None
+        now = self.clock()
+        wait = head[0] - now
+        if self.rpm_budget:
+            self._refill(now)
+            if self._tokens < 1:
+                wait = max(wait, (1 - self._tokens) * 60 / self.rpm_budget)
+        return max(0.0, wait)
+
+    def due_count(self) -> int:
+        """Products already past their due time (the backlog waiting on budget or the current batch)."""
+        now = self.clock()
+        return sum(1 for e in list(self._entries.values()) if e.next_due <= now)
+
+    def pop_due(self) -> list[dict]:
+        """Pop every product that is due now, limited by the request budget."""
+        now = self.clock()
+        self._refill(now)
+        due = []
+        while True:
+            head = self._peek()
+            if head is None or head[0] > now:
+                break
+            if self.rpm_budget and self._tokens < 1:
+                break
+            heapq.heappop(self._heap)
+            entry = self._entries[head[1]]
+            # Invalidate until rescheduled so it isn't popped twice
+            entry.version += 1
+            due.append(entry.product)
+            if self.rpm_budget:
+                self._tokens -= 1
+        return due
+
+    def reschedule(self, product: dict, info: dict | None, outcome: str):
+        key = product_key(product)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if outcome == "changed":
+            entry.interval = self.min_interval
+        elif info and 0 < (info.get("stock") or 0) <= self.low_stock:
+            entry.interval = max(self.min_interval, min(entry.interval, entry.base / 4))
+        elif outcome == "baseline":
+            entry.interval = entry.base
+        elif outcome == "unchanged":
+            entry.interval = min(self.max_interval, entry.interval * self.backoff)
+        entry.next_due = self.clock() + entry.interval
+        self._push(key, entry)
+
+    def export(self) -> dict[str, list[float]]:
+        """{key: [interval, seconds until due]} for a checkpoint."""
+        now = self.clock()
+        return {k: [e.interval, e.next_due - now] for k, e in self._entries.items()}
+
+    def restore(self, data: dict[str, list[float]], elapsed: float = 0.0) -> int:
+        """Put back checkpointed intervals and due times, `elapsed` seconds later.
+
+        Only products already added are touched; returns how many were restored.
+        """
+        now = self.clock()
+        restored = 0
+        for key, (interval, due_in) in data.items():
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            entry.interval = max(self.min_interval, min(self.max_interval, interval))
+            entry.next_due = now + max(0.0, due_in - elapsed)
+            self._push(key, entry)
+            restored += 1
+        return restored
+
+    def summary(self) -> dict:
+        intervals = [e.interval for e in self._entries.values()]
+        if not intervals:
+            return {"products": 0}
+        return {
+            "products": len(intervals),
+            "min_interval": round(min(intervals)),
+            "max_interval": round(max(intervals)),
+            "avg_interval": round(sum(intervals) / len(intervals)),
+        }
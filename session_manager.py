@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+
+import requests
+
+from logutil import log
+from http_client import safe_request
+
+BOOTSTRAP_URL = "https://shopee.co.id/"
+
+# ========= Cookie Session Cache =========
+class SessionManager:
+    """Bootstraps Shopee cookies once and reuses them across products and passes.
+
+    The jar is re-bootstrapped only when a request comes back 403, when a
+    cookie in it expires, or when it is older than `max_age` seconds. If
+    `cookie_file` is set the jar is written there after each bootstrap and
+    loaded on start-up, so short-lived runs start with warm cookies.
+    """
+
+    def __init__(self, headers_fn, session: requests.Session | None = None,
+                 cookie_file: str | None = None, max_age: int = 1800,
+                 limiter=None, bootstrap_url: str = BOOTSTRAP_URL, breakers=None):
+        self.headers_fn = headers_fn
+        self.session = session or requests.Session()
+        self.breakers = breakers
+        self.cookie_file = cookie_file
+        self.max_age = max_age
+        self.limiter = limiter
+        self.bootstrap_url = bootstrap_url
+        self.bootstrapped_at: float | None = None
+        self.bootstraps = 0
+        self._lock = threading.Lock()
+        if cookie_file:
+            self.load()
+
+    def is_expired(self) -> bool:
+        if self.bootstrapped_at is None:
+            return True
+        now = time.time()
+        if now - self.bootstrapped_at > self.max_age:
+            return True
+        if any(c.expires is not None and c.expires <= now for c in self.session.cookies):
+            # Drop them so one dead cookie doesn't force a bootstrap on every call
+            self.session.cookies.clear_expired_cookies()
+            return True
+        return False
+
+    def ensure(self) -> requests.Session:
+        if self.is_expired():
+            with self._lock:
+                # Another thread may have bootstrapped while we waited
+                if self.is_expired():
+                    self.bootstrap()
+        return self.session
+
+    def bootstrap(self) -> bool:
+        resp = safe_request(self.session, self.bootstrap_url, headers=self.headers_fn(),
+                            tag="cookie-bootstrap", limiter=self.limiter, breakers=self.breakers)
+        self.bootstraps += 1
+        if resp is None:
+            return False
+        self.bootstrapped_at = time.time()
+        # A response can carry already-expired cookies (deletions); keep them out of the jar
+        self.session.cookies.clear_expired_cookies()
+        log("info", "Cookies bootstrapped", cookies=len(self.session.cookies), status=resp.status_code)
+        if self.cookie_file:
+            self.save()
+        return True
+
+    def invalidate(self, reason: str = ""):
+        if self.bootstrapped_at is not None:
+            log("info", "Cookie jar invalidated", reason=reason)
+        self.bootstrapped_at = None
+        # Re-bootstrap from an empty jar rather than on top of the cookies that got refused
+        self.session.cookies.clear()
+
+    def note_response(self, resp) -> bool:
+        """Invalidate the jar on a 403; returns True if the caller should retry."""
+        if resp is not None and resp.status_code == 403:
+            self.invalidate(reason="403")
+            return True
+        return False
+
+    def save(self):
+        cookies = [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+             "expires": c.expires, "secure": c.secure}
+            for c in self.session.cookies
+        ]
+        tmp = f"{self.cookie_file}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"bootstrapped_at": self.bootstrapped_at, "cookies": cookies}, f)
+            os.replace(tmp, self.cookie_file)
+        except Exception as e:
+            log("warning", "Failed saving cookie jar", error=str(e))
+
+    def load(self):
+        try:
+            if not os.path.exists(self.cookie_file):
+                return
+            with open(self.cookie_file, "r") as f:
+                data = json.load(f)
+            for c in data.get("cookies", []):
+                self.session.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"],
+                                         expires=c.get("expires"), secure=c.get("secure", False))
+            self.bootstrapped_at = data.get("bootstrapped_at")
+            log("info", "Cookie jar loaded", cookies=len(data.get("cookies", [])),
+                expired=self.is_expired())
+        except Exception as e:
+            log("warning", "Failed loading cookie jar", error=str(e))
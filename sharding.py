@@ -0,0 +1,247 @@
+import os
+import time
+import socket
+import sqlite3
+import zlib
+import argparse
+import multiprocessing
+
+from logutil import log
+from batching import product_key
+from state_store import open_state_store
+from variants import VariantIndex
+from watchlist import load_watchlist
+from identity_pool import identity_specs
+
+
+def shard_of(key: str, num_shards: int) -> int:
+    return zlib.crc32(key.encode()) % num_shards
+
+
+def partition(products: list[dict], num_shards: int) -> dict[int, list[dict]]:
+    shards: dict[int, list[dict]] = {n: [] for n in range(num_shards)}
+    for product in products:
+        shards[shard_of(product_key(product), num_shards)].append(product)
+    return shards
+
+
+def worker_path(path: str, index: int) -> str:
+    """`path` with a `.worker<index>` suffix before its extension, for per-replica files."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{index}{ext}"
+
+# ========= SQLite Lease / Dedup Coordinator =========
+class SqliteCoordinator:
+    """Shard leases, worker heartbeats and alert dedup keys in one SQLite file.
+
+    Every mutation runs in a `BEGIN IMMEDIATE` transaction, so concurrent
+    processes on the same host (or a shared volume) serialize on the file.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS leases (shard INTEGER PRIMARY KEY, owner TEXT, expires_at REAL);"
+            "CREATE TABLE IF NOT EXISTS workers (owner TEXT PRIMARY KEY, home INTEGER, last_seen REAL);"
+            "CREATE TABLE IF NOT EXISTS alerts (dedup_key TEXT PRIMARY KEY, owner TEXT, created_at REAL);"
+        )
+
+    def _tx(self, sql: str, params=()) -> sqlite3.Cursor:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self._conn.execute(sql, params)
+            self._conn.execute("COMMIT")
+            return cur
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, shard: int, owner: str, ttl: float) -> bool:
+        """Take or renew a shard lease if it is free, expired or already ours."""
+        now = time.time()
+        cur = self._tx(
+            "INSERT INTO leases (shard, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(shard) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+            (shard, owner, now + ttl, now))
+        return cur.rowcount == 1
+
+    def release(self, shard: int, owner: str):
+        self._tx("DELETE FROM leases WHERE shard = ? AND owner = ?", (shard, owner))
+
+    def lease(self, shard: int) -> tuple[str, float] | None:
+        row = self._conn.execute("SELECT owner, expires_at FROM leases WHERE shard = ?", (shard,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def heartbeat(self, owner: str, home: int):
+        self._tx("INSERT INTO workers (owner, home, last_seen) VALUES (?, ?, ?)"
+                 " ON CONFLICT(owner) DO UPDATE SET home = excluded.home, last_seen = excluded.last_seen",
+                 (owner, home, time.time()))
+
+    def home_worker_alive(self, shard: int, num_workers: int, ttl: float, exclude: str) -> bool:
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM workers WHERE home = ? AND owner != ? AND last_seen >= ?",
+            (shard % num_workers, exclude, time.time() - ttl)).fetchone()
+        return row[0] > 0
+
+    def claim_alert(self, dedup_key: str, owner: str) -> bool:
+        """True for the first caller per dedup key; later claims of it return False."""
+        cur = self._tx("INSERT OR IGNORE INTO alerts (dedup_key, owner, created_at) VALUES (?, ?, ?)",
+                       (dedup_key, owner, time.time()))
+        return cur.rowcount == 1
+
+    def prune_alerts(self, older_than: float):
+        self._tx("DELETE FROM alerts WHERE created_at < ?", (time.time() - older_than,))
+
+    def close(self):
+        self._conn.close()
+
+# ========= Shard Worker =========
+class ShardWorker:
+    """Runs a ShopeeMonitor over whichever shards this worker holds leases on.
+
+    Worker `index` owns shards where `shard % num_workers == index`. A shard
+    whose lease has expired is taken over by any live worker and handed back
+    once its home worker heartbeats again. Each shard keeps its own state
+    file and variant index, reloaded whenever the shard is (re)acquired, so
+    whoever holds the lease continues from the same baselines. Alerts pass
+    through the coordinator's dedup table, so a transition a takeover
+    replays is announced at most once: the key is claimed before the alert
+    reaches the outbox, and a crash in between loses that alert.
+    """
+
+    def __init__(self, monitor, coordinator: SqliteCoordinator, products: list[dict],
+                 index: int, num_workers: int, num_shards: int | None = None,
+                 state_dir: str = ".", state_backend: str = "sqlite", lease_ttl: float = 900):
+        self.monitor = monitor
+        self.coordinator = coordinator
+        self.index = index
+        self.num_workers = num_workers
+        self.num_shards = num_shards or num_workers
+        self.state_dir = state_dir
+        self.state_backend = state_backend
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        self.shards = partition(products, self.num_shards)
+        monitor.products = products
+        self.held: set[int] = set()
+        self._stores: dict[int, object] = {}
+        self._variants: dict[int, tuple[VariantIndex, str]] = {}
+        self._started = time.time()
+        monitor.alert_gate = lambda dedup_key: coordinator.claim_alert(dedup_key, self.owner)
+
+    def _store(self, shard: int):
+        if shard not in self._stores:
+            ext = "db" if self.state_backend == "sqlite" else "json"
+            path = os.path.join(self.state_dir, f"product_state.shard{shard}.{ext}")
+            self._stores[shard] = open_state_store(path, self.state_backend)
+        return self._stores[shard]
+
+    def _variant_index(self, shard: int) -> tuple[VariantIndex, str]:
+        if shard not in self._variants:
+            path = os.path.join(self.state_dir, f"variant_index.shard{shard}.bin")
+            index = VariantIndex()
+            index.load(path)
+            self._variants[shard] = (index, path)
+        return self._variants[shard]
+
+    def _drop(self, shard: int, release: bool = True):
+        if release:
+            self.coordinator.release(shard, self.owner)
+        self.held.discard(shard)
+        store = self._stores.pop(shard, None)
+        if store is not None:
+            store.close()
+        variants = self._variants.pop(shard, None)
+        if variants is not None and variants[0].dirty:
+            variants[0].save(variants[1])
+
+    def claim_shards(self) -> set[int]:
+        self.coordinator.heartbeat(self.owner, self.index)
+        warmed_up = time.time() - self._started >= self.lease_ttl
+        for shard in range(self.num_shards):
+            home = shard % self.num_workers == self.index
+            if shard in self.held and not home and \
+                    self.coordinator.home_worker_alive(shard, self.num_workers, self.lease_ttl, self.owner):
+                log("info", "Handing shard back", shard=shard, owner=self.owner)
+                self._drop(shard)
+                continue
+            # Foreign shards are only taken over once we've seen a full lease period
+            if not home and shard not in self.held and not warmed_up:
+                continue
+            if self.coordinator.acquire(shard, self.owner, self.lease_ttl):
+                if shard not in self.held:
+                    log("info", "Shard lease acquired", shard=shard, owner=self.owner, home=home)
+                self.held.add(shard)
+            elif shard in self.held:
+                log("warning", "Shard lease lost", shard=shard, owner=self.owner)
+                self._drop(shard, release=False)
+        return self.held
+
+    def run_pass(self):
+        # Shard assignment is a pure hash of the key, so edits only move the edited products
+        if self.monitor.apply_watchlist_changes():
+            self.shards = partition(self.monitor.products, self.num_shards)
+        for shard in sorted(self.claim_shards()):
+            products = self.shards[shard]
+            if not products:
+                continue
+            self.monitor.store = self._store(shard)
+            self.monitor.variants, self.monitor.variant_file = self._variant_index(shard)
+            log("info", "Shard pass", shard=shard, products=len(products), owner=self.owner)
+            self.monitor.monitor_once(products)
+            if not self.coordinator.acquire(shard, self.owner, self.lease_ttl):
+                self._drop(shard, release=False)
+
+    def run(self, interval: int = 300, passes: int | None = None):
+        done = 0
+        try:
+            while passes is None or done < passes:
+                self.run_pass()
+                done += 1
+                self.coordinator.prune_alerts(older_than=7 * 86400)
+                if passes is None or done < passes:
+                    time.sleep(interval)
+        finally:
+            for shard in list(self.held):
+                self._drop(shard)
+            self.monitor.notifier.stop()
+
+
+def _worker_main(index: int, num_workers: int, args, products: list[dict]):
+    import main
+    monitor = main.ShopeeMonitor(
+        os.environ["TELEGRAM_BOT_TOKEN"], os.environ["TELEGRAM_CHAT_ID"],
+        # Replaced per shard by ShardWorker before any pass runs
+        state_file=worker_path(os.path.join(args.state_dir, "product_state.json"), index),
+        outbox_file=worker_path(os.path.join(args.state_dir, "telegram_outbox.json"), index),
+        cookie_file=worker_path(os.path.join(args.state_dir, "shopee_cookies.json"), index),
+        watchlist_file=args.watchlist,
+        identities=identity_specs(os.getenv("PROXIES", ""), os.getenv("IDENTITY_PROFILES", "")) or None,
+    )
+    worker = ShardWorker(monitor, SqliteCoordinator(args.coordinator), products, index, num_workers,
+                         num_shards=args.shards, state_dir=args.state_dir, lease_ttl=args.lease_ttl)
+    worker.run(interval=args.interval, passes=args.passes)
+
+
+if __name__ == "__main__":
+    # Local multi-process launcher: python sharding.py --workers 3 --watchlist products.json
+    parser = argparse.ArgumentParser(description="Run N sharded monitor workers on this host")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--watchlist", required=True, help="JSON or CSV watchlist of {shop_id, item_id}")
+    parser.add_argument("--coordinator", default="coordinator.db")
+    parser.add_argument("--state-dir", default=".")
+    parser.add_argument("--interval", type=int, default=300)
+    parser.add_argument("--lease-ttl", type=float, default=900)
+    parser.add_argument("--passes", type=int, default=None)
+    args = parser.parse_args()
+    watchlist = load_watchlist(args.watchlist)
+    procs = [multiprocessing.Process(target=_worker_main, args=(i, args.workers, args, watchlist),
+                                     name=f"shard-worker-{i}") for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
@@ -1,61 +1,52 @@
 import requests
 import os
-import json
 from datetime import datetime
 import traceback
 import time
 
+from logutil import configure_logging
+from batching import BatchFetcher
+from session_manager import SessionManager
+from method_router import MethodRouter
+from state_store import open_state_store, state_record
+from notifier import TelegramDispatcher
+from html_extract import stream_initial_state, extract_item_fields
+from variants import VariantIndex, models_from_item
+from decoding import decode_response
+from watchlist import WatchlistStore, load_watchlist
+
 class ShopeeMonitor:
-    def __init__(self, telegram_bot_token, telegram_chat_id):
+    def __init__(self, telegram_bot_token, telegram_chat_id, batch_size=50, cookie_file=None, state_backend='json',
+                 outbox_file=None, variant_file=None):
         self.telegram_bot_token = telegram_bot_token
         self.telegram_chat_id = telegram_chat_id
         self.telegram_api = f"https://api.telegram.org/bot{telegram_bot_token}"
-        self.state_file = "product_state.json"
+        self.notifier = TelegramDispatcher(self.telegram_api, telegram_chat_id, outbox_file=outbox_file)
+        self.state_file = "product_state.db" if state_backend == 'sqlite' else "product_state.json"
+        self.store = open_state_store(self.state_file, state_backend)
+        # Stok per varian (ukuran/warna), disimpan ringkas di file biner
+        self.variant_file = variant_file
+        self.variants = VariantIndex()
+        if variant_file:
+            self.variants.load(variant_file)
+        # Satu session dengan cookie yang dipakai ulang antar produk dan antar run
+        self.sessions = SessionManager(self.get_browser_headers, cookie_file=cookie_file)
+        # Urutan method adaptif berdasarkan success rate dan latency
+        self.fetch_methods = {
+            'standard_api': self.check_product_standard_api,
+            'web_scraping': self.check_product_web_scraping,
+            'mobile_api': self.check_product_mobile_api,
+            'html_scrape': self.check_product_html_scrape,
+        }
+        self.router = MethodRouter(list(self.fetch_methods))
+        self.batcher = BatchFetcher(self.sessions.session, self.get_browser_headers, batch_size=batch_size) if batch_size > 0 else None
+        # Session tanpa bootstrap cookie untuk mobile API / HTML, supaya koneksi tetap hangat antar putaran
+        self.http = requests.Session()
         
-    def load_state(self):
-        """Load status produk terakhir dari file"""
-        try:
-            if os.path.exists(self.state_file):
-                with open(self.state_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"⚠️  Warning loading state: {e}")
-        return {}
-    
-    def save_state(self, state):
-        """Simpan status produk ke file"""
-        try:
-            with open(self.state_file, 'w') as f:
-                json.dump(state, f)
-            print(f"💾 State saved: {state}")
-        except Exception as e:
-            print(f"❌ Error saving state: {e}")
-    
     def send_telegram(self, message):
-        """Kirim pesan ke Telegram"""
-        try:
-            url = f"{self.telegram_api}/sendMessage"
-            payload = {
-                'chat_id': self.telegram_chat_id,
-                'text': message,
-                'parse_mode': 'HTML',
-                'disable_web_page_preview': False
-            }
-            
-            print(f"📤 Sending to Telegram...")
-            response = requests.post(url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                print(f"✅ Telegram message sent successfully")
-                return response.json()
-            else:
-                print(f"❌ Telegram API error: {response.status_code}")
-                print(f"   Response: {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Error sending Telegram: {e}")
-            return None
+        """Antrekan pesan ke Telegram (dikirim oleh dispatcher di background)"""
+        print(f"📤 Queueing Telegram message...")
+        self.notifier.enqueue(message)
     
     def get_browser_headers(self):
         """Generate realistic browser headers"""
@@ -92,21 +83,23 @@ class ShopeeMonitor:
             
             headers = self.get_browser_headers()
             
-            session = requests.Session()
+            # Cookie di-cache; bootstrap ulang hanya kalau expired atau 403
+            if self.sessions.is_expired():
+                print(f"   🍪 Getting cookies...")
+            session = self.sessions.ensure()
             
-            # First request to get cookies
-            print(f"   🍪 Getting cookies...")
-            session.get('https://shopee.co.id/', headers=headers, timeout=15)
-            time.sleep(2)
-            
-            # Second request with cookies
             print(f"   📡 Fetching product data...")
             response = session.get(url, params=params, headers=headers, timeout=15)
             
             print(f"   📊 Status: {response.status_code}")
+            if self.sessions.note_response(response):
+                print(f"   🍪 Cookies rejected, refreshing...")
+                session = self.sessions.ensure()
+                response = session.get(url, params=params, headers=headers, timeout=15)
+                print(f"   📊 Status: {response.status_code}")
             
             if response.status_code == 200:
-                data = response.json()
+                data = decode_response(response)
                 
                 if 'item' in data:
                     item = data['item']
@@ -119,7 +112,8 @@ class ShopeeMonitor:
                         'name': name,
                         'stock': stock,
                         'price': price,
-                        'available': stock > 0
+                        'available': stock > 0,
+                        'models': models_from_item(item)
                     }
             
             print(f"   ⚠️  Response: {response.text[:200]}")
@@ -147,19 +141,20 @@ class ShopeeMonitor:
                 'X-Requested-With': 'XMLHttpRequest',
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=15)
+            response = self.http.get(url, params=params, headers=headers, timeout=15)
             
             print(f"   📊 Status: {response.status_code}")
             
             if response.status_code == 200:
-                data = response.json()
+                data = decode_response(response)
                 if 'data' in data and data['data']:
                     item = data['data']
                     return {
                         'name': item.get('name', 'Unknown'),
                         'stock': item.get('stock', 0),
                         'price': item.get('price', 0) / 100000,
-                        'available': item.get('stock', 0) > 0
+                        'available': item.get('stock', 0) > 0,
+                        'models': models_from_item(item)
                     }
             
         except Exception as e:
@@ -175,94 +170,118 @@ class ShopeeMonitor:
             url = f"https://shopee.co.id/product/{shop_id}/{item_id}"
             headers = self.get_browser_headers()
             
-            response = requests.get(url, headers=headers, timeout=15)
+            # Stream halaman dan berhenti setelah script __INITIAL_STATE__ selesai
+            response = self.http.get(url, headers=headers, timeout=15, stream=True)
             
             if response.status_code == 200:
-                html = response.text
+                blob = stream_initial_state(response)
+                fields = extract_item_fields(blob) if blob else None
                 
-                # Cari JSON data di HTML
-                if '__INITIAL_STATE__' in html:
-                    start = html.find('__INITIAL_STATE__=') + len('__INITIAL_STATE__=')
-                    end = html.find('</script>', start)
-                    json_str = html[start:end].strip()
-                    
-                    # Clean JSON
-                    if json_str.endswith(';'):
-                        json_str = json_str[:-1]
+                if fields:
+                    item_data = fields['model']
                     
-                    data = json.loads(json_str)
-                    
-                    # Navigate through the data structure
-                    if 'item' in data and 'models' in data['item']:
-                        item_data = list(data['item']['models'].values())[0]
-                        
-                        return {
-                            'name': item_data.get('name', 'Unknown'),
-                            'stock': item_data.get('stock', 0),
-                            'price': item_data.get('price', 0) / 100000,
-                            'available': item_data.get('stock', 0) > 0
-                        }
+                    return {
+                        'name': item_data.get('name') or fields['item_name'] or 'Unknown',
+                        'stock': item_data.get('stock', 0),
+                        'price': item_data.get('price', 0) / 100000,
+                        'available': item_data.get('stock', 0) > 0,
+                        'models': models_from_item({'models': fields['models']})
+                    }
+            else:
+                response.close()
             
         except Exception as e:
             print(f"   ❌ HTML scraping failed: {e}")
         
         return None
     
-    def check_product(self, shop_id, item_id):
-        """Try multiple methods to get product info"""
-        
-        # Try Method 1: Standard API
+    def check_product_standard_api(self, shop_id, item_id):
+        """Method 1: Standard API"""
         try:
             print(f"   🌐 Method 1: Standard API...")
             url = "https://shopee.co.id/api/v4/item/get"
             params = {'shopid': shop_id, 'itemid': item_id}
             headers = self.get_browser_headers()
             
-            response = requests.get(url, params=params, headers=headers, timeout=15)
+            response = self.sessions.ensure().get(url, params=params, headers=headers, timeout=15)
             print(f"   📊 Status: {response.status_code}")
+            self.sessions.note_response(response)
             
             if response.status_code == 200:
-                data = response.json()
+                data = decode_response(response)
                 if 'data' in data and data['data']:
                     item = data['data']
                     return {
                         'name': item.get('name', 'Unknown'),
                         'stock': item.get('stock', 0),
                         'price': item.get('price', 0) / 100000,
-                        'available': item.get('stock', 0) > 0
+                        'available': item.get('stock', 0) > 0,
+                        'models': models_from_item(item)
                     }
         except:
             pass
         
-        # Try Method 2: PC API
-        result = self.check_product_web_scraping(shop_id, item_id)
-        if result:
-            return result
-        
-        # Try Method 3: Mobile API
-        result = self.check_product_mobile_api(shop_id, item_id)
-        if result:
-            return result
-        
-        # Try Method 4: HTML Scraping
-        result = self.check_product_html_scrape(shop_id, item_id)
+        return None
+    
+    def check_product(self, shop_id, item_id):
+        """Try multiple methods to get product info, best method first"""
+        result = self.router.run(self.fetch_methods, shop_id, item_id)
         if result:
             return result
         
         print(f"   ❌ All methods failed")
         return None
     
-    def monitor(self, products):
-        """Monitor produk dan kirim notifikasi jika ada perubahan"""
-        print(f"🤖 GitHub Actions - Shopee Monitor v3.0")
-        print(f"⏰ Runtime: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
-        print("=" * 60)
-        
-        state = self.load_state()
-        print(f"📂 Previous state: {state}")
+    def check_variants(self, updates, names, items):
+        """Bandingkan stok semua varian sekaligus dan kirim notifikasi per varian"""
+        changes = self.variants.apply(updates)
+        for change in changes:
+            product, info, product_changed = items[change.item_key]
+            variant_name = names.get((change.item_key, change.model_id)) or str(change.model_id)
+            restock = change.kind == 'restock'
+            print(f"   🎨 Variant {variant_name} ({change.item_key}): {change.old_stock} → {change.new_stock}")
+            
+            # Perubahan level produk sudah dikirim
+            if product_changed:
+                continue
+            
+            message = (
+                f"{'✅' if restock else '❌'} <b>{'VARIAN READY!' if restock else 'VARIAN HABIS!'}</b>\n\n"
+                f"📦 <b>{info['name']}</b>\n"
+                f"🎨 Varian: {variant_name}\n"
+                f"💰 Rp {change.new_price:,.0f}\n"
+                f"📊 {change.new_stock} unit\n"
+                f"🕐 {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n\n"
+                f"🔗 <a href='https://shopee.co.id/product/{product['shop_id']}/{product['item_id']}'>Lihat Produk</a>"
+            )
+            self.send_telegram(message)
         
-        new_state = {}
+        if self.variant_file and self.variants.dirty:
+            self.variants.save(self.variant_file)
+    
+    def run_pass(self, products):
+        """Satu putaran cek semua produk; state disimpan di akhir putaran"""
+        # Ambil banyak produk sekaligus per toko, sisanya lewat check_product
+        if self.batcher:
+            self.sessions.ensure()
+        prefetched = self.batcher.fetch_many(products) if self.batcher else {}
+        if self.batcher:
+            print(f"📦 Batch lookup: {len(prefetched)}/{len(products)} resolved")
         
+        # Perubahan dalam satu putaran digabung jadi digest kalau banyak;
+        # kalau ada error di tengah, notifikasi dan state yang sudah ada tetap tersimpan
+        with self.notifier.collect():
+            try:
+                self.check_products(products, prefetched)
+            finally:
+                self.store.commit()
+        print(f"💾 State saved: {len(self.store)} product(s)")
+    
+    def check_products(self, products, prefetched):
+        """Cek tiap produk, kirim notifikasi perubahan dan update state"""
+        variant_updates = []
+        variant_names = {}
+        changed_items = {}
         for idx, product in enumerate(products, 1):
             shop_id = product['shop_id']
             item_id = product['item_id']
@@ -270,11 +289,16 @@ class ShopeeMonitor:
             
             print(f"\n🔍 [{idx}/{len(products)}] Checking: {product_key}")
             
-            info = self.check_product(shop_id, item_id)
+            info = prefetched.get(product_key)
+            if info:
+                print(f"   ⚡ Resolved via batch lookup")
+            else:
+                info = self.check_product(shop_id, item_id)
             
             if info:
                 current_status = info['available']
-                previous_status = state.get(product_key)
+                record = self.store.get(product_key)
+                previous_status = record['available'] if record else None
                 
                 print(f"\n   ✅ Product found!")
                 print(f"   📦 {info['name']}")
@@ -297,22 +321,76 @@ class ShopeeMonitor:
                     
                     self.send_telegram(message)
                 
-                new_state[product_key] = current_status
+                self.store.upsert(product_key, state_record(info))
+                
+                changed_items[product_key] = (product, info, previous_status is not None and previous_status != current_status)
+                for model_id, model_name, stock, price in info.get('models') or []:
+                    variant_updates.append((product_key, model_id, stock, price))
+                    variant_names[(product_key, model_id)] = model_name
             else:
                 print(f"   ⚠️  Failed to get info, keeping old state")
-                if product_key in state:
-                    new_state[product_key] = state[product_key]
             
-            time.sleep(3)  # Delay between products
+            if product_key not in prefetched:
+                time.sleep(3)  # Delay between products
         
-        self.save_state(new_state)
+        self.check_variants(variant_updates, variant_names, changed_items)
+    
+    def monitor(self, products, budget=0, poll_interval=60, exit_margin=20, watchlist=None):
+        """Monitor produk dan kirim notifikasi jika ada perubahan.
+        
+        Dengan `budget` (detik) > 0 proses tetap hidup dan mengulang putaran
+        setiap `poll_interval` detik dengan session yang sama. Putaran baru
+        tidak dimulai kalau tidak sempat selesai `exit_margin` detik sebelum
+        budget habis, jadi proses keluar bersih sebelum jadwal cron berikutnya.
+        """
+        started = time.monotonic()
+        print(f"🤖 GitHub Actions - Shopee Monitor v3.0")
+        print(f"⏰ Runtime: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+        if budget > 0:
+            print(f"⏳ Persistent mode: budget {budget}s, poll every {poll_interval}s")
+        print("=" * 60)
+        
+        print(f"📂 Previous state: {len(self.store)} product(s)")
+        
+        passes = 0
+        while True:
+            pass_started = time.monotonic()
+            if watchlist is not None:
+                watchlist.poll()
+                products = watchlist.products() or products
+            self.run_pass(products)
+            passes += 1
+            pass_duration = time.monotonic() - pass_started
+            if budget <= 0:
+                break
+            remaining = budget - (time.monotonic() - started)
+            if remaining < poll_interval + pass_duration + exit_margin:
+                print(f"\n⏹️  Budget almost used ({remaining:.0f}s left), stopping after {passes} pass(es)")
+                break
+            print(f"\n⏳ Pass {passes} took {pass_duration:.1f}s, next in {poll_interval}s ({remaining:.0f}s left)")
+            time.sleep(poll_interval)
+        
+        # Checkpoint: cookie jar dan outbox disimpan supaya run berikutnya langsung hangat
+        if self.sessions.cookie_file and self.sessions.bootstrapped_at is not None:
+            self.sessions.save()
+        # Sisa pesan tetap aman di outbox kalau waktunya habis
+        flush_timeout = 60 if budget <= 0 else max(1.0, budget - (time.monotonic() - started))
+        if not self.notifier.flush(timeout=flush_timeout):
+            print(f"⚠️  {self.notifier.pending()} Telegram message(s) left in outbox")
+        self.notifier.stop(timeout=0)
+        
+        print("\n📈 Method stats:")
+        for name, stats in self.router.summary().items():
+            print(f"   {name}: {stats}")
         
         print("\n" + "=" * 60)
-        print("✅ Monitoring completed!")
+        print(f"✅ Monitoring completed! ({passes} pass(es) in {time.monotonic() - started:.0f}s)")
         print("=" * 60)
 
 
 if __name__ == "__main__":
+    configure_logging(level=os.environ.get('LOG_LEVEL', 'info'),
+                      sample_every=int(os.environ.get('LOG_SAMPLE_EVERY', '1')))
     print("🚀 SHOPEE TELEGRAM MONITOR - GITHUB ACTIONS")
     print("=" * 60)
     
@@ -331,8 +409,25 @@ if __name__ == "__main__":
             'item_id': '28841260015'
         }
     ]
+    WATCHLIST_FILE = os.environ.get('WATCHLIST_FILE', 'watchlist.json')
+    if os.path.exists(WATCHLIST_FILE):
+        PRODUCTS = load_watchlist(WATCHLIST_FILE) or PRODUCTS
     
     print(f"📦 Monitoring {len(PRODUCTS)} product(s)\n")
     
-    bot = ShopeeMonitor(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID)
-    bot.monitor(PRODUCTS)
+    BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '50'))
+    COOKIE_FILE = os.environ.get('COOKIE_FILE', 'shopee_cookies.json')
+    STATE_BACKEND = os.environ.get('STATE_BACKEND', 'json').lower()
+    OUTBOX_FILE = os.environ.get('OUTBOX_FILE', 'telegram_outbox.json')
+    VARIANT_FILE = os.environ.get('VARIANT_FILE', 'variant_index.bin')
+    # Persistent mode: tetap jalan selama RUN_BUDGET detik (0 = sekali jalan seperti biasa)
+    RUN_BUDGET = int(os.environ.get('RUN_BUDGET', '0'))
+    POLL_INTERVAL = int(os.environ.get('POLL_INTERVAL', '60'))
+    EXIT_MARGIN = int(os.environ.get('EXIT_MARGIN', '20'))
+    
+    bot = ShopeeMonitor(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, batch_size=BATCH_SIZE,
+                        cookie_file=COOKIE_FILE, state_backend=STATE_BACKEND, outbox_file=OUTBOX_FILE,
+                        variant_file=VARIANT_FILE)
+    watchlist = WatchlistStore(WATCHLIST_FILE) if RUN_BUDGET > 0 and os.path.exists(WATCHLIST_FILE) else None
+    bot.monitor(PRODUCTS, budget=RUN_BUDGET, poll_interval=POLL_INTERVAL, exit_margin=EXIT_MARGIN,
+                watchlist=watchlist)
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from logutil import log
+from metrics import STATE_SECONDS
+
+STATE_BACKENDS = ("json", "sqlite")
+
+
+def _atomic_write_json(path: str, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _normalize(value) -> dict:
+    # Legacy product_state.json stored only the `available` boolean
+    if isinstance(value, dict):
+        return value
+    return {"available": bool(value), "stock": None, "price": None, "name": None, "updated_at": None}
+
+# ========= State Backends =========
+class JsonStateStore:
+    """Whole-file JSON state, loaded lazily and replaced atomically on commit."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: dict | None = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = {}
+            try:
+                if os.path.exists(self.path):
+                    with open(self.path, "r") as f:
+                        self._data = {k: _normalize(v) for k, v in json.load(f).items()}
+                    log("info", "State loaded", backend="json", entries=len(self._data))
+            except Exception as e:
+                log("warning", "Failed loading state", error=str(e))
+        return self._data
+
+    def get(self, key: str) -> dict | None:
+        started = time.perf_counter()
+        with self._lock:
+            record = self._load().get(key)
+        STATE_SECONDS.observe(time.perf_counter() - started, "json", "get")
+        return record
+
+    def upsert(self, key: str, record: dict):
+        started = time.perf_counter()
+        with self._lock:
+            self._load()[key] = record
+            self._dirty = True
+        STATE_SECONDS.observe(time.perf_counter() - started, "json", "upsert")
+
+    def items(self) -> dict:
+        with self._lock:
+            return dict(self._load())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+    @contextmanager
+    def transaction(self):
+        yield self
+        self.commit()
+
+    def commit(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                with STATE_SECONDS.time("json", "commit"):
+                    _atomic_write_json(self.path, self._data)
+                self._dirty = False
+                log("info", "State saved", backend="json", entries=len(self._data))
+            except Exception as e:
+                log("error", "Failed saving state", error=str(e))
+
+    def snapshot(self, dest: str):
+        with self._lock:
+            _atomic_write_json(dest, self._load())
+
+    def close(self):
+        self.commit()
+
+
+class SqliteStateStore:
+    """SQLite state with per-key upserts; nothing is loaded until asked for."""
+
+    def __init__(self, path: str, legacy_json: str | None = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS product_state ("
+            " key TEXT PRIMARY KEY, available INTEGER NOT NULL,"
+            " stock INTEGER, price REAL, name TEXT, updated_at REAL)"
+        )
+        self._in_tx = False
+        if legacy_json and len(self) == 0 and os.path.exists(legacy_json):
+            self._import_json(legacy_json)
+
+    def _import_json(self, path: str):
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            with self.transaction():
+                for key, value in data.items():
+                    self.upsert(key, _normalize(value))
+            log("info", "Imported legacy state", source=path, entries=len(data))
+        except Exception as e:
+            log("warning", "Failed importing legacy state", source=path, error=str(e))
+
+    def get(self, key: str) -> dict | None:
+        started = time.perf_counter()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT available, stock, price, name, updated_at FROM product_state WHERE key = ?",
+                (key,)).fetchone()
+        STATE_SECONDS.observe(time.perf_counter() - started, "sqlite", "get")
+        if row is None:
+            return None
+        return {"available": bool(row[0]), "stock": row[1], "price": row[2],
+                "name": row[3], "updated_at": row[4]}
+
+    def upsert(self, key: str, record: dict):
+        started = time.perf_counter()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO product_state (key, available, stock, price, name, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET available = excluded.available,"
+                " stock = excluded.stock, price = excluded.price, name = excluded.name,"
+                " updated_at = excluded.updated_at",
+                (key, int(bool(record.get("available"))), record.get("stock"), record.get("price"),
+                 record.get("name"), record.get("updated_at")))
+        STATE_SECONDS.observe(time.perf_counter() - started, "sqlite", "upsert")
+
+    def items(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, available, stock, price, name, updated_at FROM product_state").fetchall()
+        return {r[0]: {"available": bool(r[1]), "stock": r[2], "price": r[3],
+                       "name": r[4], "updated_at": r[5]} for r in rows}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM product_state").fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """Group a pass's upserts into one commit; rolled back on error."""
+        with self._lock:
+            if self._in_tx:
+                yield self
+                return
+            self._conn.execute("BEGIN")
+            self._in_tx = True
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                with STATE_SECONDS.time("sqlite", "commit"):
+                    self._conn.execute("COMMIT")
+            finally:
+                self._in_tx = False
+
+    def commit(self):
+        pass
+
+    def snapshot(self, dest: str):
+        tmp = f"{dest}.tmp"
+        with self._lock:
+            target = sqlite3.connect(tmp)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+        os.replace(tmp, dest)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_state_store(path: str, backend: str = "json"):
+    if backend not in STATE_BACKENDS:
+        raise ValueError(f"Unknown state backend {backend!r}, expected one of {STATE_BACKENDS}")
+    if backend == "sqlite":
+        legacy = os.path.splitext(path)[0] + ".json"
+        return SqliteStateStore(path, legacy_json=legacy if legacy != path else None)
+    return JsonStateStore(path)
+
+
+def state_record(info: dict) -> dict:
+    return {
+        "available": info["available"],
+        "stock": info.get("stock"),
+        "price": info.get("price"),
+        "name": info.get("name"),
+        "updated_at": time.time(),
+    }
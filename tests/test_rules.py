@@ -0,0 +1,43 @@
+import logutil
+from bench.fake_shopee import FakeShopee, FakeConfig
+from bench.bench_monitor import redirect_to
+import main
+from rules import RuleEngine
+
+logutil.configure_logging(level="error")
+
+
+def run_flips(tmp_path, rules: dict, stocks: list[int]) -> list[str]:
+    fake = FakeShopee(FakeConfig(flip_rate=0.0, models_per_item=1))
+    base = fake.start()
+    product = {"shop_id": "100", "item_id": "2000", "rules": rules}
+    try:
+        with redirect_to(base):
+            monitor = main.ShopeeMonitor("t", "bench-chat", state_file=str(tmp_path / "state.json"), result_ttl=0)
+            monitor.products = [product]
+            for stock in stocks:
+                fake._stock[("100", "2000")] = stock
+                monitor.monitor_once(monitor.products)
+            monitor.notifier.stop(timeout=10)
+    finally:
+        fake.stop()
+    return [msg.split("\n")[0] for msg in fake.telegram_messages]
+
+
+def test_price_rule_keeps_stock_flip_alerts(tmp_path):
+    # The fake catalogue prices items at Rp 15,000, so this rule never fires
+    sent = run_flips(tmp_path, {"price_below": 1000}, [5, 0, 5, 0, 5])
+    assert sent == ["❌ <b>PRODUK HABIS!</b>", "✅ <b>PRODUK READY!</b>"] * 2
+
+
+def test_back_in_stock_rule_replaces_restock_alert(tmp_path):
+    sent = run_flips(tmp_path, {"back_in_stock": True}, [5, 0, 5])
+    assert sent == ["❌ <b>PRODUK HABIS!</b>", "✅ <b>PRODUK READY!</b>"]
+
+
+def test_covers_flip():
+    engine = RuleEngine()
+    assert engine.covers_flip({"rules": {"back_in_stock": True}}, True)
+    assert not engine.covers_flip({"rules": {"back_in_stock": True}}, False)
+    assert not engine.covers_flip({"rules": {"price_below": 1000}}, True)
+    assert not engine.covers_flip({}, True)
@@ -0,0 +1,153 @@
+import os
+from array import array
+
+from logutil import log
+
+MISSING = -1
+
+
+class VariantChange:
+    __slots__ = ("item_key", "model_id", "old_stock", "new_stock", "old_price", "new_price")
+
+    def __init__(self, item_key, model_id, old_stock, new_stock, old_price, new_price):
+        self.item_key = item_key
+        self.model_id = model_id
+        self.old_stock = old_stock
+        self.new_stock = new_stock
+        self.old_price = old_price
+        self.new_price = new_price
+
+    @property
+    def kind(self) -> str:
+        return "restock" if self.new_stock > 0 else "soldout"
+
+
+def models_from_item(item: dict) -> list[tuple[int, str, int, float]]:
+    """Reduce an item's `models` (list or dict) to (model_id, name, stock, price_rp) tuples."""
+    models = item.get("models") or []
+    if isinstance(models, dict):
+        models = list(models.values())
+    out = []
+    for m in models:
+        if not isinstance(m, dict) or m.get("modelid") is None:
+            continue
+        raw_price = m.get("price", 0)
+        price_rp = (raw_price / 100000) if isinstance(raw_price, (int, float)) else 0
+        out.append((int(m["modelid"]), str(m.get("name") or ""), int(m.get("stock") or 0), price_rp))
+    return out
+
+# ========= Compact Variant Index =========
+class VariantIndex:
+    """(item_key, model_id) -> stock/price held in flat typed columns.
+
+    Stock and price (in cents) live in `array` columns addressed by a row
+    number; the only per-variant Python object is the dict entry mapping
+    the key to its row. Rows freed by `drop_item()` are reused. `apply()`
+    diffs a whole pass worth of updates in one loop.
+    """
+
+    def __init__(self):
+        self._rows: dict[tuple[str, int], int] = {}
+        self._item_rows: dict[str, list[int]] = {}
+        self._keys: list[tuple[str, int] | None] = []
+        self._stock = array("l")
+        self._price = array("q")
+        self._free: list[int] = []
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, item_key: str, model_id: int) -> tuple[int, float] | None:
+        row = self._rows.get((item_key, model_id))
+        if row is None:
+            return None
+        return self._stock[row], self._price[row] / 100
+
+    def _new_row(self, key: tuple[str, int], stock: int, price_cents: int) -> int:
+        if self._free:
+            row = self._free.pop()
+            self._keys[row] = key
+            self._stock[row] = stock
+            self._price[row] = price_cents
+        else:
+            row = len(self._keys)
+            self._keys.append(key)
+            self._stock.append(stock)
+            self._price.append(price_cents)
+        self._rows[key] = row
+        self._item_rows.setdefault(key[0], []).append(row)
+        return row
+
+    def apply(self, updates) -> list[VariantChange]:
+        """Apply (item_key, model_id, stock, price_rp) updates; return changes vs. the stored rows."""
+        changes = []
+        rows = self._rows
+        stock_col = self._stock
+        price_col = self._price
+        for item_key, model_id, stock, price in updates:
+            cents = int(round(price * 100))
+            row = rows.get((item_key, model_id))
+            if row is None:
+                self._new_row((item_key, model_id), stock, cents)
+                self.dirty = True
+                continue
+            old_stock = stock_col[row]
+            old_cents = price_col[row]
+            if old_stock != stock or old_cents != cents:
+                if (old_stock > 0) != (stock > 0):
+                    changes.append(VariantChange(item_key, model_id, old_stock, stock,
+                                                 old_cents / 100, price))
+                stock_col[row] = stock
+                price_col[row] = cents
+                self.dirty = True
+        return changes
+
+    def drop_item(self, item_key: str):
+        for row in self._item_rows.pop(item_key, []):
+            key = self._keys[row]
+            if key is not None:
+                del self._rows[key]
+            self._keys[row] = None
+            self._stock[row] = MISSING
+            self._free.append(row)
+        self.dirty = True
+
+    # ----- persistence -----
+    def save(self, path: str):
+        """Columns go out as raw arrays plus a key file; written via tmp + rename."""
+        live = [r for r, k in enumerate(self._keys) if k is not None]
+        stock = array("l", (self._stock[r] for r in live))
+        price = array("q", (self._price[r] for r in live))
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                keys = "\n".join(f"{self._keys[r][0]}\t{self._keys[r][1]}" for r in live).encode()
+                f.write(len(live).to_bytes(8, "little"))
+                f.write(len(keys).to_bytes(8, "little"))
+                f.write(keys)
+                stock.tofile(f)
+                price.tofile(f)
+            os.replace(tmp, path)
+            self.dirty = False
+        except Exception as e:
+            log("warning", "Failed saving variant index", error=str(e))
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                count = int.from_bytes(f.read(8), "little")
+                key_len = int.from_bytes(f.read(8), "little")
+                keys = f.read(key_len).decode().split("\n") if count else []
+                stock = array("l")
+                stock.fromfile(f, count)
+                price = array("q")
+                price.fromfile(f, count)
+            for line, s, p in zip(keys, stock, price):
+                item_key, _, model_id = line.partition("\t")
+                self._new_row((item_key, int(model_id)), s, p)
+            log("info", "Variant index loaded", variants=count)
+        except Exception as e:
+            log("warning", "Failed loading variant index", error=str(e))
@@ -0,0 +1,179 @@
+import os
+import csv
+import json
+import threading
+
+from logutil import log
+from batching import product_key
+from rules import RULE_TYPES
+
+# Stands for TELEGRAM_CHAT_ID in a product's `chats` list
+DEFAULT_CHAT = "default"
+
+
+class WatchlistDiff:
+    __slots__ = ("added", "removed", "updated")
+
+    def __init__(self, added: list[dict], removed: list[dict], updated: list[dict]):
+        self.added = added
+        self.removed = removed
+        self.updated = updated
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.updated)
+
+
+def _normalize_product(raw: dict) -> dict | None:
+    shop_id = str(raw.get("shop_id") or "").strip()
+    item_id = str(raw.get("item_id") or "").strip()
+    if not shop_id or not item_id:
+        return None
+    product = {"shop_id": shop_id, "item_id": item_id}
+    if raw.get("interval"):
+        product["interval"] = int(raw["interval"])
+    chats = raw.get("chats")
+    if isinstance(chats, str):
+        # CSV: "chat1;chat2"
+        chats = chats.replace(",", ";").split(";")
+    chats = list(dict.fromkeys(str(c).strip() for c in chats or () if str(c).strip()))
+    if chats:
+        product["chats"] = chats
+    rules = dict(raw.get("rules") or {})
+    # CSV has no nesting, so rules come as their own columns there
+    for rule in RULE_TYPES:
+        value = raw.get(rule)
+        if value not in (None, ""):
+            rules[rule] = True if rule == "back_in_stock" else float(value)
+    if rules:
+        product["rules"] = rules
+    return product
+
+
+def subscribers(product: dict, default_chat: str) -> list[str]:
+    """Chats alerted for `product`; no `chats` list (or a "default" entry) means `default_chat`."""
+    chats = product.get("chats") or [DEFAULT_CHAT]
+    return list(dict.fromkeys(default_chat if c == DEFAULT_CHAT else c for c in chats))
+
+
+def load_watchlist(path: str) -> list[dict]:
+    """Read products from a JSON list (or {"products": [...]}) or a CSV with a header row.
+
+    Repeated entries for one product are merged into one, with their `chats`
+    combined, so each product is fetched once however many chats watch it.
+    """
+    with open(path, "r", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            data = json.load(f)
+            rows = data.get("products", []) if isinstance(data, dict) else data
+    products: dict[str, dict] = {}
+    for row in rows:
+        product = _normalize_product(row)
+        if product is None:
+            log("warning", "Invalid watchlist entry ignored", entry=row)
+            continue
+        key = product_key(product)
+        first = products.get(key)
+        if first is None:
+            products[key] = product
+        elif "chats" in first or "chats" in product:
+            chats = first.get("chats", [DEFAULT_CHAT]) + product.get("chats", [DEFAULT_CHAT])
+            first["chats"] = list(dict.fromkeys(chats))
+    return list(products.values())
+
+# ========= Hot-Reloadable Watchlist =========
+class WatchlistStore:
+    """File-backed watchlist that notices edits and reports them as a diff.
+
+    `poll()` is cheap (one `os.stat`) and only re-reads the file when its
+    mtime or size changed. `add()` / `remove()` edit the list in memory and
+    write it back as JSON, so command handlers can share the same store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._products: dict[str, dict] = {}
+        # What the last poll() handed out; edits are diffed against this
+        self._reported: dict[str, dict] = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._reload(self._file_stamp())
+            self._reported = dict(self._products)
+
+    def products(self) -> list[dict]:
+        with self._lock:
+            return list(self._products.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._products
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _reload(self, stamp):
+        try:
+            products = load_watchlist(self.path)
+        except Exception as e:
+            # Keep running on the last good list while the file is mid-edit or broken
+            log("warning", "Watchlist reload failed", path=self.path, error=str(e))
+            return
+        with self._lock:
+            self._stamp = stamp
+            self._products = {product_key(p): p for p in products}
+        log("info", "Watchlist reloaded", path=self.path, products=len(products))
+
+    def poll(self) -> WatchlistDiff:
+        """Return what changed since the previous poll, from file edits or add()/remove()."""
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self._stamp:
+            self._reload(stamp)
+        with self._lock:
+            new, old = self._products, self._reported
+            added = [p for k, p in new.items() if k not in old]
+            removed = [p for k, p in old.items() if k not in new]
+            updated = [p for k, p in new.items() if k in old and old[k] != p]
+            self._reported = dict(new)
+        return WatchlistDiff(added, removed, updated)
+
+    def _check_writable(self):
+        if self.path.lower().endswith(".csv"):
+            raise ValueError("CSV watchlists are read-only; use a JSON watchlist for add/remove")
+
+    def add(self, product: dict) -> bool:
+        self._check_writable()
+        product = _normalize_product(product)
+        if product is None:
+            return False
+        with self._lock:
+            key = product_key(product)
+            if self._products.get(key) == product:
+                return False
+            self._products = {**self._products, key: product}
+            self._save()
+        return True
+
+    def remove(self, key: str) -> bool:
+        self._check_writable()
+        with self._lock:
+            if key not in self._products:
+                return False
+            self._products = {k: p for k, p in self._products.items() if k != key}
+            self._save()
+        return True
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(list(self._products.values()), f, indent=2)
+        os.replace(tmp, self.path)
+        # Our own write shouldn't come back as an external edit
+        self._stamp = self._file_stamp()